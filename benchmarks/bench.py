@@ -0,0 +1,215 @@
+"""Замеры горячего пути на файлах расписания из репозитория.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench.py --output bench_results.json
+
+Все сетевые обращения идут к локальному HTTP-серверу, который отдаёт
+сохранённую страницу benchmarks/fixtures/studentam.html и xls из downloads/.
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import http.server
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import main  # noqa: E402
+import server  # noqa: E402
+from bot import format_schedule_text  # noqa: E402
+
+FIXTURE_HTML = ROOT / "benchmarks" / "fixtures" / "studentam.html"
+WORKBOOKS = sorted((ROOT / "downloads").glob("*.xls")) + [ROOT / "eeke.xls"]
+# Страница в фикстуре опубликована 24 декабря - на этот день и "замораживаем" сегодня
+FROZEN_TODAY = (12, 24)
+
+
+class FrozenDate(dt.date):
+    @classmethod
+    def today(cls):
+        return cls(dt.datetime.now().year, *FROZEN_TODAY)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.startswith("/studentam"):
+            body = FIXTURE_HTML.read_bytes()
+            content_type = "text/html; charset=utf-8"
+        else:
+            path = ROOT / "downloads" / Path(self.path).name
+            if not path.exists():
+                self.send_error(404)
+                return
+            body = path.read_bytes()
+            content_type = "application/vnd.ms-excel"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    samples: list[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "max_ms": round(max(samples), 4),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def run(repeat: int) -> dict:
+    results: dict[str, dict] = {}
+    html = FIXTURE_HTML.read_text(encoding="utf-8")
+    fallback_html = html.replace("gw-document-item", "doc-item")
+
+    results["parse_schedule_links"] = measure(
+        lambda: main.parse_schedule_links(html), repeat
+    )
+    results["parse_schedule_links[fallback]"] = measure(
+        lambda: main.parse_schedule_links(fallback_html), repeat
+    )
+    # Повторный вызов с той же страницей - отдаётся из кэша по хэшу
+    results["find_schedule_links[unchanged]"] = measure(
+        lambda: main.find_schedule_links(html), repeat
+    )
+
+    for path in WORKBOOKS:
+        rows = main.read_excel_rows(path)
+        groups = list(main.build_schedule_index(rows))
+        results[f"read_excel_rows[{path.name}]"] = measure(
+            lambda: main.read_excel_rows(path), repeat
+        )
+        results[f"parse_schedule_for_group[{path.name}]"] = measure(
+            lambda: [main.parse_schedule_for_group(rows, group) for group in groups],
+            repeat,
+        )
+        results[f"build_schedule_index[{path.name}]"] = measure(
+            lambda: main.build_schedule_index(rows), repeat
+        )
+
+        index = main.build_schedule_index(rows)
+        payloads = [
+            (group, {"schedule": schedule, "previous_schedule": schedule})
+            for group, schedule in index.items()
+        ]
+        results[f"format_schedule_text[{path.name}]"] = measure(
+            lambda: [format_schedule_text(group, payload) for group, payload in payloads],
+            repeat,
+        )
+
+    results.update(run_fetch_path(repeat))
+    return results
+
+
+def run_fetch_path(repeat: int) -> dict:
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_port}"
+
+    workdir = Path(tempfile.mkdtemp(prefix="schedule-bench-"))
+    saved = {
+        "BASE_URL": main.BASE_URL,
+        "STUDENTS_URL": main.STUDENTS_URL,
+        "SNAPSHOT_DIR": main.SNAPSHOT_DIR,
+        "DOWNLOAD_DIR": server.DOWNLOAD_DIR,
+        "date": server.date,
+    }
+    main.BASE_URL = base_url
+    main.STUDENTS_URL = f"{base_url}/studentam/"
+    main.SNAPSHOT_DIR = workdir / "parsed"
+    server.DOWNLOAD_DIR = workdir / "downloads"
+    server.date = FrozenDate
+
+    def reset_caches() -> None:
+        main.invalidate_page_cache()
+        main._page_validators.clear()
+        main._schedule_index_cache.clear()
+        main._file_hash_cache.clear()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results: dict[str, dict] = {}
+    try:
+        # download_file печатает ход загрузки - в замерах это не нужно
+        with contextlib.redirect_stdout(io.StringIO()):
+            for offset in (0, 1, 2):
+                label = f"fetch_group_schedule_for_offset[{offset}]"
+                results[f"{label}[cold]"] = measure(
+                    lambda: server.fetch_group_schedule_for_offset("158", offset),
+                    repeat,
+                    setup=reset_caches,
+                )
+                results[f"{label}[warm]"] = measure(
+                    lambda: server.fetch_group_schedule_for_offset("158", offset),
+                    repeat,
+                )
+    finally:
+        httpd.shutdown()
+        main.BASE_URL = saved["BASE_URL"]
+        main.STUDENTS_URL = saved["STUDENTS_URL"]
+        main.SNAPSHOT_DIR = saved["SNAPSHOT_DIR"]
+        server.DOWNLOAD_DIR = saved["DOWNLOAD_DIR"]
+        server.date = saved["date"]
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора расписания")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", type=Path, default=ROOT / "bench_results.json")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+    args.output.write_text(
+        json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+
+    width = max(len(name) for name in results)
+    for name, stats in results.items():
+        print(f"{name:<{width}}  median {stats['median_ms']:>9.3f} ms  min {stats['min_ms']:>9.3f} ms")
+    print(f"\nРезультаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
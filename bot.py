@@ -1,39 +1,73 @@
 import asyncio
-import hashlib
-import json
 import os
 import re
+import time
+from collections import OrderedDict
 from pathlib import Path
 
 from aiogram import Bot, Dispatcher, F, Router, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.filters import Command, CommandStart
+from aiohttp import web
 from dotenv import load_dotenv
 
+import state_store
+from http_client import close_session, download_file_async, get_schedule_links_async
 from main import (
-    STUDENTS_URL,
-    download_file,
-    fetch_page,
-    find_schedule_links,
-    parse_schedule_for_group,
-    read_excel_rows,
+    file_sha256,
+    group_candidates,
+    group_keys,
+    group_sort_key,
+    load_parsed_snapshot,
+    lookup_group_schedule,
+    schedule_hash,
+)
+from metrics import (
+    CONTENT_TYPE,
+    WATCHER_POLLS,
+    WATCHER_POLL_SECONDS,
+    count_cache,
+    monitor_event_loop_lag,
+    render_metrics,
+    timed,
+)
+from notifier import fan_out
+from poll_scheduler import PollScheduler
+from prefetch import (
+    prefetch_loop,
+    prefetched_day_snapshots,
+    prefetched_days,
+    prefetched_group_schedule,
 )
 from server import (
-    fetch_group_schedule,
-    fetch_group_schedule_for_offset,
-    get_near_schedule_days,
+    fetch_group_schedule_days_async,
+    fetch_group_schedule_for_offset_async,
+    fetch_group_schedule_for_snapshot_async,
+    get_near_schedule_days_async,
+    resolve_lookup_async,
     select_daily_schedule_link,
     extract_schedule_date,
 )
+from tracing import add_tags, span, trace
 from text_config import (
     HELP_TEXT,
     DAY_BUTTON_AFTER_TOMORROW,
+    DAY_BUTTON_ALL,
     DAY_BUTTON_TODAY,
     DAY_BUTTON_TOMORROW,
+    NO_NEAR_SCHEDULE_TEXT,
+    format_day_title,
     format_new_schedule_prefix,
     format_updated_schedule_prefix,
     DAY_QUESTION_TEXT,
+    FREE_USAGE_TEXT,
+    ROOM_USAGE_TEXT,
+    TEACHER_USAGE_TEXT,
     format_bind_group,
+    format_free_rooms,
+    format_group_suggestions,
+    format_groups_list,
+    format_lookup_result,
     format_group_add_welcome,
     format_header,
     format_pair_header,
@@ -45,63 +79,28 @@ from text_config import (
     NO_LESSON_SUBJECT,
     PIN_BUTTON_TEXT,
 )
+from workers import load_schedule_index_async, run_async, shutdown_executor
 
 
 load_dotenv()
 router = Router()
-STATE_PATH = Path("bot_state.json")
-
-
-def load_state() -> dict:
-    if not STATE_PATH.exists():
-        return {
-            "chats": {},
-            "last_schedule_file": None,
-            "last_schedule_hash": None,
-            "last_schedules_by_group": {},
-        }
-    try:
-        data = json.loads(STATE_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        data = {}
-    data.setdefault("chats", {})
-    data.setdefault("last_schedule_file", None)
-    data.setdefault("last_schedule_hash", None)
-    data.setdefault("last_schedules_by_group", {})
-    return data
-
-
-def save_state(state: dict) -> None:
-    STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
 def save_chat_group(chat_id: int, group: str) -> None:
-    state = load_state()
-    chats = state.setdefault("chats", {})
-    chats[str(chat_id)] = {"group": group, "notifications": True}
-    save_state(state)
+    state_store.set_chat_group(chat_id, group)
 
 
 def get_chat_group(chat_id: int) -> str | None:
-    state = load_state()
-    chats = state.get("chats", {})
-    cfg = chats.get(str(chat_id))
+    cfg = state_store.get_chat(chat_id)
     if not cfg:
         return None
-    group = cfg.get("group")
-    return group
+    return cfg.get("group")
 
 
 def toggle_chat_notifications(chat_id: int) -> tuple[bool, bool]:
-    state = load_state()
-    chats = state.setdefault("chats", {})
-    cfg = chats.get(str(chat_id))
-    if not cfg:
+    new_value = state_store.toggle_notifications(chat_id)
+    if new_value is None:
         return False, False
-    current = cfg.get("notifications", True)
-    new_value = not current
-    cfg["notifications"] = new_value
-    save_state(state)
     return True, new_value
 
 
@@ -125,9 +124,12 @@ def extract_group(text: str) -> str | None:
     return match.group(1).strip()
 
 
+@timed("format_schedule_text")
 def format_schedule_text(group: str, payload: dict) -> str:
     schedule = payload.get("schedule") or []
     previous = payload.get("previous_schedule") or []
+    if not schedule and payload.get("suggestions"):
+        return format_group_suggestions(group, payload["suggestions"])
     if not schedule:
         return f"Для группы {group} ничего не найдено в последнем расписании."
 
@@ -238,6 +240,56 @@ def format_schedule_text(group: str, payload: dict) -> str:
     return "\n".join(lines)
 
 
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "512"))
+
+_render_cache: OrderedDict[tuple, str] = OrderedDict()
+_render_pending: dict[tuple, asyncio.Future] = {}
+
+
+def render_cache_key(group: str, payload: dict) -> tuple:
+    schedule = payload.get("schedule") or []
+    previous = payload.get("previous_schedule") or []
+    return (
+        group,
+        schedule_hash(schedule),
+        schedule_hash(previous) if previous else None,
+        tuple(payload.get("suggestions") or ()),
+    )
+
+
+async def render_schedule_text(group: str, payload: dict) -> str:
+    # Текст зависит только от группы и двух расписаний - рендерим один раз
+    key = render_cache_key(group, payload)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        _render_cache.move_to_end(key)
+        count_cache("render", True)
+        return cached
+
+    pending = _render_pending.get(key)
+    if pending is not None:
+        count_cache("render", True)
+        return await asyncio.shield(pending)
+
+    count_cache("render", False)
+    future = asyncio.get_running_loop().create_future()
+    _render_pending[key] = future
+    try:
+        text = await run_async(format_schedule_text, group, payload)
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()
+        raise
+    finally:
+        _render_pending.pop(key, None)
+
+    future.set_result(text)
+    _render_cache[key] = text
+    while len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+    return text
+
+
 @router.message(CommandStart())
 async def handle_start(message: types.Message) -> None:
     text = (
@@ -326,6 +378,83 @@ async def handle_list_command(message: types.Message) -> None:
     await send_schedule_for_group(message, group)
 
 
+async def answer_lookup(message: types.Message, build_text) -> None:
+    # Поиск по ближайшему опубликованному дню через обратный индекс файла
+    try:
+        _, _, d, lookup = await resolve_lookup_async()
+    except Exception:
+        await message.answer(
+            "Не удалось получить расписание:( Свяжитесь с администратором",
+            parse_mode="HTML",
+        )
+        return
+    await message.answer(build_text(lookup, d.strftime("%d.%m")), parse_mode="HTML")
+
+
+@router.message(Command("teacher"))
+async def handle_teacher_command(message: types.Message) -> None:
+    parts = (message.text or "").split(maxsplit=1)
+    name = parts[1].strip() if len(parts) > 1 else ""
+    if len(name) < 2:
+        await message.answer(TEACHER_USAGE_TEXT, parse_mode="HTML")
+        return
+    await answer_lookup(
+        message,
+        lambda lookup, date_str: format_lookup_result(
+            name, date_str, lookup.find_teacher(name)
+        ),
+    )
+
+
+@router.message(Command("room"))
+async def handle_room_command(message: types.Message) -> None:
+    args = (message.text or "").split()[1:]
+    pair = None
+    if len(args) > 1 and args[-1].isdigit():
+        pair = int(args.pop())
+    room = " ".join(args)
+    if not room:
+        await message.answer(ROOM_USAGE_TEXT, parse_mode="HTML")
+        return
+    await answer_lookup(
+        message,
+        lambda lookup, date_str: format_lookup_result(
+            f"Аудитория {room}", date_str, lookup.find_room(room, pair)
+        ),
+    )
+
+
+@router.message(Command("groups"))
+async def handle_groups_command(message: types.Message) -> None:
+    parts = (message.text or "").split(maxsplit=1)
+    prefix = parts[1].strip() if len(parts) > 1 else ""
+
+    def build_text(lookup, date_str: str) -> str:
+        keys = group_keys(lookup.index)
+        if prefix:
+            groups = group_candidates(keys, prefix)
+        else:
+            groups = sorted(keys, key=group_sort_key)
+        return format_groups_list(date_str, groups)
+
+    await answer_lookup(message, build_text)
+
+
+@router.message(Command("free"))
+async def handle_free_command(message: types.Message) -> None:
+    args = (message.text or "").split()[1:]
+    if len(args) != 1 or not args[0].isdigit():
+        await message.answer(FREE_USAGE_TEXT, parse_mode="HTML")
+        return
+    pair = int(args[0])
+    await answer_lookup(
+        message,
+        lambda lookup, date_str: format_free_rooms(
+            pair, date_str, lookup.free_rooms(pair), lookup.busy_rooms(pair)
+        ),
+    )
+
+
 @router.message()
 async def handle_plain_group(message: types.Message) -> None:
     text = (message.text or "").strip()
@@ -394,10 +523,12 @@ async def handle_bot_status_change(event: types.ChatMemberUpdated, bot: Bot) ->
 async def handle_day_choice(callback: types.CallbackQuery) -> None:
     data = callback.data or ""
     parts = data.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         await callback.answer()
         return
-    _, offset_str, group = parts
+    # day:<offset>:<group>[:<snapshot>] - старые кнопки без снимка тоже работают
+    _, offset_str, group = parts[:3]
+    snapshot = parts[3] if len(parts) == 4 else None
     try:
         offset = int(offset_str)
     except ValueError:
@@ -408,30 +539,66 @@ async def handle_day_choice(callback: types.CallbackQuery) -> None:
         await callback.answer()
         return
 
-    try:
-        payload = fetch_group_schedule_for_offset(group, offset)
-    except Exception:
-        await callback.message.edit_text(
-            "Не удалось получить расписание:( Свяжитесь с администратором",
-            parse_mode="HTML",
-        )
-        await callback.answer()
-        return
+    with trace("day_choice", group=group, offset=offset, snapshot=snapshot):
+        try:
+            payload = None
+            if snapshot:
+                # Ровно тот файл, из которого строились кнопки
+                payload = await fetch_group_schedule_for_snapshot_async(group, snapshot)
+                count_cache("snapshot_id", payload is not None)
+            if payload is None:
+                payload = prefetched_group_schedule(group, offset)
+                count_cache("prefetch", payload is not None)
+                add_tags(prefetched=payload is not None)
+            if payload is None:
+                payload = await fetch_group_schedule_for_offset_async(group, offset)
+        except Exception:
+            await callback.message.edit_text(
+                "Не удалось получить расписание:( Свяжитесь с администратором",
+                parse_mode="HTML",
+            )
+            await callback.answer()
+            return
 
-    text = format_schedule_text(group, payload)
+        with span("render_schedule_text"):
+            text = await render_schedule_text(group, payload)
     keyboard = build_pin_keyboard()
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
     await callback.answer()
 
 
+# Telegram ограничивает callback_data 64 байтами
+CALLBACK_DATA_LIMIT = 64
+
+
+def day_callback_data(offset: int, group: str, snapshots: dict[int, str]) -> str:
+    data = f"day:{offset}:{group}"
+    snapshot = snapshots.get(offset)
+    if snapshot:
+        pinned = f"{data}:{snapshot}"
+        if len(pinned.encode("utf-8")) <= CALLBACK_DATA_LIMIT:
+            return pinned
+    return data
+
+
 async def send_schedule_for_group(message: types.Message, group: str) -> None:
+    with trace("group_request", group=group):
+        await reply_with_schedule(message, group)
+
+
+async def reply_with_schedule(message: types.Message, group: str) -> None:
     loading = await message.answer(
         f"Секунду. Расписание для группы {group}..", parse_mode="HTML"
     )
-    try:
-        days = get_near_schedule_days()
-    except Exception:
-        days = {}
+    days = prefetched_days()
+    count_cache("prefetch", days is not None)
+    snapshots = prefetched_day_snapshots() if days is not None else {}
+    if days is None:
+        try:
+            with span("near_schedule_days"):
+                days = await get_near_schedule_days_async()
+        except Exception:
+            days = {}
 
     available_offsets = sorted(days.keys())
 
@@ -442,14 +609,14 @@ async def send_schedule_for_group(message: types.Message, group: str) -> None:
             row.append(
                 types.InlineKeyboardButton(
                     text=f"{DAY_BUTTON_TODAY} ({days[0]})",
-                    callback_data=f"day:0:{group}",
+                    callback_data=day_callback_data(0, group, snapshots),
                 )
             )
         if 1 in days:
             row.append(
                 types.InlineKeyboardButton(
                     text=f"{DAY_BUTTON_TOMORROW} ({days[1]})",
-                    callback_data=f"day:1:{group}",
+                    callback_data=day_callback_data(1, group, snapshots),
                 )
             )
         if row:
@@ -459,11 +626,19 @@ async def send_schedule_for_group(message: types.Message, group: str) -> None:
             row2.append(
                 types.InlineKeyboardButton(
                     text=f"{DAY_BUTTON_AFTER_TOMORROW} ({days[2]})",
-                    callback_data=f"day:2:{group}",
+                    callback_data=day_callback_data(2, group, snapshots),
                 )
             )
         if row2:
             buttons.append(row2)
+        if len(available_offsets) > 1:
+            buttons.append(
+                [
+                    types.InlineKeyboardButton(
+                        text=DAY_BUTTON_ALL, callback_data=f"days:{group}"
+                    )
+                ]
+            )
 
         keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await loading.edit_text(DAY_QUESTION_TEXT, reply_markup=keyboard, parse_mode="HTML")
@@ -471,7 +646,9 @@ async def send_schedule_for_group(message: types.Message, group: str) -> None:
 
     if 0 in days:
         try:
-            payload = fetch_group_schedule_for_offset(group, 0)
+            payload = prefetched_group_schedule(group, 0)
+            if payload is None:
+                payload = await fetch_group_schedule_for_offset_async(group, 0)
         except Exception:
             await loading.edit_text(
                 "Не удалось получить расписание:( Свяжитесь с администратором",
@@ -479,97 +656,281 @@ async def send_schedule_for_group(message: types.Message, group: str) -> None:
             )
             return
 
-        text = format_schedule_text(group, payload)
+        text = await render_schedule_text(group, payload)
         keyboard = build_pin_keyboard()
         await loading.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
         return
 
-    await loading.edit_text(
-        "Для ближайших дней расписание на сайте ещё не опубликовано.",
+    await loading.edit_text(NO_NEAR_SCHEDULE_TEXT, parse_mode="HTML")
+
+
+# Telegram не принимает сообщения длиннее 4096 символов
+MESSAGE_TEXT_LIMIT = 4096
+
+
+async def collect_group_days(group: str) -> list[dict]:
+    # Дни из фонового каталога отдаются сразу, иначе все файлы готовятся параллельно
+    days = prefetched_days()
+    count_cache("prefetch", bool(days))
+    if days:
+        collected: list[dict] = []
+        for offset in sorted(days):
+            payload = prefetched_group_schedule(group, offset)
+            if payload is None:
+                break
+            payload["offset"] = offset
+            collected.append(payload)
+        else:
+            return collected
+    return await fetch_group_schedule_days_async(group)
+
+
+async def render_day_block(group: str, day: dict) -> str:
+    title = format_day_title(day["offset"], day.get("date"))
+    if day.get("error"):
+        return f"{title}\n{day['error']}"
+    return f"{title}\n{await render_schedule_text(group, day)}"
+
+
+def split_message_blocks(blocks: list[str]) -> list[str]:
+    chunks: list[str] = []
+    for block in blocks:
+        if chunks and len(chunks[-1]) + 2 + len(block) <= MESSAGE_TEXT_LIMIT:
+            chunks[-1] += "\n\n" + block
+        else:
+            chunks.append(block)
+    return chunks
+
+
+@router.callback_query(F.data.startswith("days:"))
+async def handle_all_days_choice(callback: types.CallbackQuery) -> None:
+    group = (callback.data or "").partition(":")[2]
+    if not group or not callback.message:
+        await callback.answer()
+        return
+
+    with trace("all_days", group=group):
+        try:
+            days = await collect_group_days(group)
+        except Exception:
+            await callback.message.edit_text(
+                "Не удалось получить расписание:( Свяжитесь с администратором",
+                parse_mode="HTML",
+            )
+            await callback.answer()
+            return
+
+        if not days:
+            await callback.message.edit_text(NO_NEAR_SCHEDULE_TEXT, parse_mode="HTML")
+            await callback.answer()
+            return
+
+        with span("render_schedule_text", days=len(days)):
+            blocks = await asyncio.gather(*(render_day_block(group, day) for day in days))
+
+    chunks = split_message_blocks(list(blocks))
+    await callback.message.edit_text(
+        chunks[0],
+        reply_markup=build_pin_keyboard() if len(chunks) == 1 else None,
         parse_mode="HTML",
     )
+    for i, chunk in enumerate(chunks[1:], start=2):
+        await callback.message.answer(
+            chunk,
+            reply_markup=build_pin_keyboard() if i == len(chunks) else None,
+            parse_mode="HTML",
+        )
+    await callback.answer()
+
+
+def previous_group_schedule(version: dict | None, group: str) -> list[dict] | None:
+    # Прошлое расписание группы берём из сохранённого снимка того файла,
+    # из которого его доставили в последний раз
+    if not version or not version.get("file_sha256"):
+        return None
+    index = load_parsed_snapshot(version["file_sha256"])
+    if index is None:
+        return None
+    return lookup_group_schedule(index, group) or None
+
+
+async def watch_once(bot: Bot) -> str:
+    # Вотчер всегда идёт на сайт (условным запросом) и заодно обновляет кэш страницы
+    links = await get_schedule_links_async(ttl=0)
+    if not links:
+        return "no_links"
+
+    link = select_daily_schedule_link(links)
+    if not link:
+        return "no_links"
+
+    add_tags(file=link["filename"])
+    download_dir = Path("downloads")
+    path = await download_file_async(link, download_dir)
+    file_hash = file_sha256(path)
+
+    last_file = state_store.get_meta("last_schedule_file")
+    last_hash = state_store.get_meta("last_schedule_hash")
+
+    is_new_file = file_hash != last_hash or path.name != last_file
+    if not is_new_file:
+        return "unchanged"
+
+    with span("load_schedule_index", file=path.name):
+        index = await load_schedule_index_async(path)
+    if not index:
+        return "empty"
+
+    schedule_date = extract_schedule_date(link)
+    date_str = schedule_date.strftime("%d.%m") if schedule_date else None
+    # Версии групп сравниваем в пределах одного дня: файл на завтра
+    # с теми же парами, что сегодня, всё равно рассылается
+    day_key = schedule_date.isoformat() if schedule_date else link["url"]
+
+    async def notify_group(group: str, chat_ids: list[int]) -> bool:
+        with span("notify_group", group=group, chats=len(chat_ids)):
+            return await deliver_group(group, chat_ids)
+
+    async def deliver_group(group: str, chat_ids: list[int]) -> bool:
+        # True - группа обработана и её версию можно больше не рассылать
+        new_schedule = lookup_group_schedule(index, group)
+        if not new_schedule:
+            return True
+
+        # Файл мог перезалить ради другой группы - сравниваем сами пары
+        new_hash = schedule_hash(new_schedule)
+        version = state_store.get_group_version(group, day_key)
+        if version and version["schedule_hash"] == new_hash:
+            return True
+
+        delivered = state_store.delivered_chats(group, day_key, new_hash, chat_ids)
+        pending = [chat_id for chat_id in chat_ids if chat_id not in delivered]
+        if not pending:
+            state_store.set_group_version(group, day_key, new_hash, file_hash)
+            return True
+
+        # Новый день показываем относительно последнего разосланного
+        version = version or state_store.latest_group_version(group)
+
+        old_schedule = previous_group_schedule(version, group)
+        payload = {"schedule": new_schedule}
+        if old_schedule is not None:
+            payload["previous_schedule"] = old_schedule
+
+        with span("render_schedule_text"):
+            body = await render_schedule_text(group, payload)
+
+        if version is None:
+            prefix = format_new_schedule_prefix(date_str)
+        else:
+            prefix = format_updated_schedule_prefix(date_str)
+
+        text = prefix + "\n\n" + body
+
+        with span("fan_out"):
+            results = await fan_out(
+                bot,
+                pending,
+                text,
+                parse_mode="HTML",
+                reply_markup=build_pin_keyboard(),
+            )
+        # Заблокировавшие бота и пропавшие чаты тоже считаем обработанными
+        done = [chat_id for chat_id, result in results.items() if result != "failed"]
+        state_store.mark_chats_delivered(group, day_key, new_hash, done)
+        if len(done) < len(pending):
+            # Версию группы не двигаем - следующая проверка дошлёт только неудачным
+            return False
+
+        state_store.set_group_version(group, day_key, new_hash, file_hash)
+        return True
+
+    subscribers = state_store.subscribed_chats_by_group()
+    results = await asyncio.gather(
+        *(
+            notify_group(group, chat_ids)
+            for group, chat_ids in subscribers.items()
+        ),
+        return_exceptions=True,
+    )
+
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"Ошибка рассылки: {type(result).__name__}: {result}")
+    if any(result is not True for result in results):
+        # Файл не помечаем обработанным, чтобы следующая проверка дослала остальное
+        return "partial"
+
+    state_store.set_meta_values(
+        {"last_schedule_file": path.name, "last_schedule_hash": file_hash}
+    )
+    return "changed"
+
+
+watcher_scheduler = PollScheduler.from_env()
 
 
 async def schedule_watcher(bot: Bot) -> None:
     while True:
-        try:
-            state = load_state()
-            html = fetch_page(STUDENTS_URL)
-            links = find_schedule_links(html)
-            if not links:
-                await asyncio.sleep(300)
-                continue
-
-            link = select_daily_schedule_link(links)
-            if not link:
-                await asyncio.sleep(300)
-                continue
-
-            download_dir = Path("downloads")
-            path = download_file(link, download_dir)
-            content = path.read_bytes()
-            file_hash = hashlib.sha256(content).hexdigest()
-
-            last_file = state.get("last_schedule_file")
-            last_hash = state.get("last_schedule_hash")
-
-            is_new_file = file_hash != last_hash or path.name != last_file
-            if not is_new_file:
-                await asyncio.sleep(300)
-                continue
-
-            rows = read_excel_rows(path)
-            if not rows:
-                await asyncio.sleep(300)
-                continue
-
-            last_schedules_by_group = state.setdefault("last_schedules_by_group", {})
-            chats = state.get("chats", {})
-
-            for chat_id_str, cfg in chats.items():
-                group = cfg.get("group")
-                if not group:
-                    continue
-                if not cfg.get("notifications", True):
-                    continue
-
-                new_schedule = parse_schedule_for_group(rows, group)
-                if not new_schedule:
-                    continue
-
-                old_schedule = last_schedules_by_group.get(group)
-                payload = {"schedule": new_schedule}
-                if old_schedule is not None:
-                    payload["previous_schedule"] = old_schedule
-
-                body = format_schedule_text(group, payload)
-
-                schedule_date = extract_schedule_date(link)
-                date_str = schedule_date.strftime("%d.%m") if schedule_date else None
-
-                if old_schedule is None:
-                    prefix = format_new_schedule_prefix(date_str)
-                else:
-                    prefix = format_updated_schedule_prefix(date_str)
-
-                text = prefix + "\n\n" + body
-
-                await bot.send_message(
-                    chat_id=int(chat_id_str),
-                    text=text,
-                    parse_mode="HTML",
-                    reply_markup=build_pin_keyboard(),
-                )
+        started = time.monotonic()
+        error = None
+        with trace("watch_cycle"):
+            try:
+                outcome = await watch_once(bot)
+            except Exception as exc:
+                outcome = "error"
+                error = f"{type(exc).__name__}: {exc}"
+                print(f"Ошибка проверки расписания: {error}")
+            add_tags(outcome=outcome)
+        duration = time.monotonic() - started
+        WATCHER_POLLS.inc(outcome=outcome)
+        WATCHER_POLL_SECONDS.observe(duration)
+        delay = watcher_scheduler.record(outcome, duration, error)
+        await asyncio.sleep(delay)
+
+
+# Метрики процесса бота в том же текстовом формате, что /metrics у API,
+# и история проверок вотчера на /debug/polls. BOT_METRICS_PORT=0 отключает экспортер.
+BOT_METRICS_HOST = os.environ.get("BOT_METRICS_HOST", "127.0.0.1")
+BOT_METRICS_PORT = int(os.environ.get("BOT_METRICS_PORT", "9101"))
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode("utf-8"),
+        headers={"Content-Type": CONTENT_TYPE},
+    )
 
-                last_schedules_by_group[group] = new_schedule
 
-            state["last_schedule_file"] = path.name
-            state["last_schedule_hash"] = file_hash
-            save_state(state)
-        except Exception:
-            pass
+async def handle_polls(request: web.Request) -> web.Response:
+    try:
+        limit = int(request.query.get("limit", "0"))
+    except ValueError:
+        raise web.HTTPBadRequest(text="limit должен быть числом")
+    return web.json_response(
+        {
+            "failures": watcher_scheduler.failures,
+            "polls": watcher_scheduler.recent(limit),
+        }
+    )
+
 
-        await asyncio.sleep(300)
+async def start_metrics_exporter() -> web.AppRunner | None:
+    if not BOT_METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/debug/polls", handle_polls)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, BOT_METRICS_HOST, BOT_METRICS_PORT).start()
+    except OSError as exc:
+        # Порт занят (второй экземпляр бота) - бот работает и без метрик
+        print(f"Экспортер метрик не запущен ({BOT_METRICS_HOST}:{BOT_METRICS_PORT}): {exc}")
+        await runner.cleanup()
+        return None
+    return runner
 
 
 async def main() -> None:
@@ -583,8 +944,18 @@ async def main() -> None:
     dispatcher.include_router(router)
 
     asyncio.create_task(schedule_watcher(bot))
+    asyncio.create_task(prefetch_loop("bot"))
+    asyncio.create_task(monitor_event_loop_lag("bot"))
+    metrics_runner = await start_metrics_exporter()
 
-    await dispatcher.start_polling(bot)
+    try:
+        await dispatcher.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_session()
+        shutdown_executor()
+        state_store.close_connection()
 
 
 @router.callback_query(F.data == "pin_schedule")
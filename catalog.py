@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+
+from http_client import download_file_async, get_schedule_links_async
+from main import DOWNLOAD_DIR, extract_schedule_date, file_sha256
+from workers import load_schedule_index_async
+
+
+# Каталог всех опубликованных файлов расписания: каждый файл со страницы
+# студентов скачивается и разбирается один раз, а дальше вопросы
+# "какие группы есть", "какой файл на 25 декабря" решаются по каталогу.
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+CATALOG_INTERVAL = float(os.environ.get("CATALOG_INTERVAL", "120"))
+# Файлы с сайта перекачивает только один процесс ("bot" или "api"),
+# второй читает их готовые копии из общей папки загрузок
+CATALOG_OWNER = os.environ.get("CATALOG_OWNER", "bot")
+
+_catalog: dict[str, dict] = {}
+_ready = False
+_refresh_lock = asyncio.Lock()
+
+
+async def ingest_link(link: dict, semaphore: asyncio.Semaphore, revalidate: bool) -> dict:
+    entry = {
+        "url": link["url"],
+        "filename": link["filename"],
+        "description": link.get("description", ""),
+        "date": extract_schedule_date(link),
+        "link": link,
+        "path": None,
+        "sha256": None,
+        "status": "pending",
+        "error": None,
+        "groups": [],
+        "index": {},
+        "updated_at": None,
+    }
+    try:
+        async with semaphore:
+            path = await download_file_async(link, DOWNLOAD_DIR, force=revalidate)
+        index = await load_schedule_index_async(path)
+        entry["path"] = path
+        entry["sha256"] = file_sha256(path)
+        entry["index"] = index
+        entry["groups"] = list(index)
+        entry["status"] = "ok" if index else "empty"
+    except Exception as exc:
+        entry["status"] = "error"
+        entry["error"] = f"{type(exc).__name__}: {exc}"
+        previous = _catalog.get(link["url"])
+        if previous and previous["status"] == "ok":
+            # Сайт не ответил - оставляем последнюю удачную версию
+            return previous
+    entry["updated_at"] = time.time()
+    return entry
+
+
+async def ingest_all(links: list[dict], revalidate: bool = True) -> dict[str, dict]:
+    global _catalog
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    entries = await asyncio.gather(
+        *(ingest_link(link, semaphore, revalidate) for link in links)
+    )
+    _catalog = {entry["url"]: entry for entry in entries}
+    return _catalog
+
+
+async def refresh_catalog(revalidate: bool = True) -> bool:
+    # Каждый цикл файлы перепроверяются условными запросами (обычно 304),
+    # поэтому перезалитый под тем же адресом файл тоже попадает в каталог.
+    # Без revalidate качаются только файлы, которых ещё нет на диске
+    global _ready
+    async with _refresh_lock:
+        links = await get_schedule_links_async()
+        before = {url: entry["sha256"] for url, entry in _catalog.items()}
+        await ingest_all(links, revalidate)
+        _ready = True
+        after = {url: entry["sha256"] for url, entry in _catalog.items()}
+        return before != after
+
+
+async def catalog_loop(process: str) -> None:
+    revalidate = process == CATALOG_OWNER
+    while True:
+        try:
+            await refresh_catalog(revalidate)
+        except Exception:
+            pass
+        await asyncio.sleep(CATALOG_INTERVAL)
+
+
+def catalog_ready() -> bool:
+    return _ready
+
+
+def catalog_entries() -> list[dict]:
+    return list(_catalog.values())
+
+
+def catalog_entry(url: str) -> dict | None:
+    return _catalog.get(url)
+
+
+def catalog_summary() -> list[dict]:
+    summary: list[dict] = []
+    for entry in _catalog.values():
+        summary.append(
+            {
+                "url": entry["url"],
+                "filename": entry["filename"],
+                "description": entry["description"],
+                "date": entry["date"].isoformat() if entry["date"] else None,
+                "sha256": entry["sha256"],
+                "status": entry["status"],
+                "error": entry["error"],
+                "groups": entry["groups"],
+            }
+        )
+    return summary
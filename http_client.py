@@ -0,0 +1,130 @@
+import asyncio
+import os
+from pathlib import Path
+
+import aiohttp
+
+from main import (
+    STUDENTS_URL,
+    cached_page,
+    conditional_headers,
+    find_schedule_links,
+    fresh_students_page,
+    remember_page,
+    response_validators,
+    revalidation_headers,
+    save_downloaded_file,
+    store_download_validators,
+    store_students_page,
+)
+from metrics import HTTP_RESPONSES, STAGE_SECONDS, count_cache
+from tracing import span
+
+
+# Асинхронный доступ к сайту колледжа для бота: одна сессия с keep-alive
+# на весь процесс, чтобы медленная загрузка не блокировала event loop.
+HTTP_LIMIT = int(os.environ.get("HTTP_LIMIT", "20"))
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", "4"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+PAGE_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=HTTP_CONNECT_TIMEOUT)
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=HTTP_CONNECT_TIMEOUT)
+
+_session: aiohttp.ClientSession | None = None
+_page_task: asyncio.Task | None = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ssl=False,
+            keepalive_timeout=60,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_page_async(url: str) -> str:
+    cached = cached_page(url)
+    session = await get_session()
+    with STAGE_SECONDS.time(stage="fetch_page"), span("fetch_page", url=url):
+        async with session.get(
+            url, headers=conditional_headers(cached), timeout=PAGE_TIMEOUT
+        ) as response:
+            HTTP_RESPONSES.inc(kind="page", status=response.status)
+            if response.status == 304 and cached:
+                return cached["text"]
+            response.raise_for_status()
+            body = await response.read()
+            text = await response.text(errors="replace")
+
+    remember_page(url, response.headers, len(body), text)
+    return text
+
+
+async def _load_students_page() -> tuple[str, list[dict]]:
+    html = await fetch_page_async(STUDENTS_URL)
+    links = find_schedule_links(html)
+    store_students_page(html, links)
+    return html, links
+
+
+async def get_students_page_async(ttl: float | None = None) -> tuple[str, list[dict]]:
+    # Тот же кэш, что и у main.get_students_page; параллельные промахи
+    # ждут одну общую задачу загрузки
+    global _page_task
+    fresh = fresh_students_page(ttl)
+    count_cache("page", fresh is not None)
+    if fresh:
+        return fresh
+
+    if _page_task is None or _page_task.done():
+        _page_task = asyncio.ensure_future(_load_students_page())
+    return await asyncio.shield(_page_task)
+
+
+async def get_schedule_links_async(ttl: float | None = None) -> list[dict]:
+    _, links = await get_students_page_async(ttl)
+    return links
+
+
+async def download_file_async(
+    file_info: dict, target_dir: Path, force: bool = True
+) -> Path:
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target_path = target_dir / file_info["filename"]
+
+    if not force and target_path.exists():
+        return target_path
+
+    headers = revalidation_headers(file_info, target_path)
+
+    session = await get_session()
+    with STAGE_SECONDS.time(stage="download_file"), span(
+        "download_file", file=file_info["filename"]
+    ):
+        async with session.get(
+            file_info["url"], headers=headers, timeout=DOWNLOAD_TIMEOUT
+        ) as response:
+            HTTP_RESPONSES.inc(kind="file", status=response.status)
+            if response.status == 304 and headers:
+                return target_path
+            response.raise_for_status()
+            content = await response.read()
+
+    save_downloaded_file(target_path, content)
+    store_download_validators(
+        target_dir,
+        file_info["url"],
+        response_validators(response.headers, len(content)),
+    )
+    return target_path
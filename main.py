@@ -1,11 +1,24 @@
+import hashlib
+import json
+import os
 import re
+import struct
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, datetime
+from difflib import get_close_matches
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import openpyxl
 import requests
 import urllib3
 import xlrd
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from metrics import HTTP_RESPONSES, STAGE_SECONDS, count_cache, timed
+from tracing import span
 
 # Отключаем предупреждения о небезопасном соединении (так как мы будем игнорировать проверку SSL)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -13,18 +26,110 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 BASE_URL = "https://spo35-kaduienrgycol.gosuslugi.ru"
 STUDENTS_URL = f"{BASE_URL}/studentam/"
+PAGE_CACHE_TTL = float(os.environ.get("SCHEDULE_PAGE_TTL", "60"))
+DOWNLOAD_DIR = Path("downloads")
+SNAPSHOT_DIR = Path(os.environ.get("SCHEDULE_CACHE_DIR", "cache")) / "parsed"
+
+
+VALIDATORS_FILENAME = ".validators.json"
+
+_page_validators: dict[str, dict] = {}
+_download_validators_lock = threading.Lock()
+
+
+def conditional_headers(validators: dict | None) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    if not validators:
+        return headers
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def response_validators(headers, size: int) -> dict:
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "size": size,
+    }
+
+
+def cached_page(url: str) -> dict | None:
+    return _page_validators.get(url)
+
 
+def remember_page(url: str, headers, size: int, text: str) -> None:
+    validators = response_validators(headers, size)
+    if validators["etag"] or validators["last_modified"]:
+        validators["text"] = text
+        _page_validators[url] = validators
 
+
+@timed("fetch_page")
 def fetch_page(url: str) -> str:
-    # Упрощаем до минимума, как было раньше
-    response = requests.get(url, timeout=30, verify=False)
+    # Повторные запросы - условные: при 304 отдаём сохранённый текст
+    cached = cached_page(url)
+    response = requests.get(
+        url, timeout=30, verify=False, headers=conditional_headers(cached)
+    )
+    HTTP_RESPONSES.inc(kind="page", status=response.status_code)
+    if response.status_code == 304 and cached:
+        return cached["text"]
     response.raise_for_status()
+
+    remember_page(url, response.headers, len(response.content), response.text)
     return response.text
 
 
-def find_schedule_links(html: str) -> list[dict]:
-    soup = BeautifulSoup(html, "html.parser")
+def schedule_link_entry(href: str, description: str) -> dict:
+    filename_match = re.search(r"[^/]+$", href)
+    filename = filename_match.group(0) if filename_match else "schedule.xls"
+
+    absolute_url = href if href.startswith("http") else f"{BASE_URL}{href}"
+
+    return {
+        "url": absolute_url,
+        "filename": filename,
+        "description": description or filename,
+    }
+
+
+def is_excel_href(href: str) -> bool:
+    href_lower = href.lower()
+    return ".xls" in href_lower or ".xlsx" in href_lower
+
+
+# Разбираем только блоки документов, остальная страница (меню, подвал)
+# в дерево не попадает
+DOCUMENT_ITEMS = SoupStrainer("div", class_="gw-document-item")
+DOCUMENT_ITEM_START = re.compile(
+    r"<div\b[^>]*\bclass\s*=\s*[\"'][^\"']*(?<![\w-])gw-document-item(?![\w-])", re.I
+)
+RAW_TEXT_TAGS = ("script", "style", "textarea")
 
+
+def document_items_region(html: str) -> str:
+    # Всё, что до первого блока документа (шапка, меню), можно не токенизировать,
+    # если срез не попадает внутрь <script>/<style>
+    match = DOCUMENT_ITEM_START.search(html)
+    if not match:
+        return html
+    prefix = html[: match.start()].lower()
+    for tag in RAW_TEXT_TAGS:
+        if prefix.count(f"<{tag}") != prefix.count(f"</{tag}"):
+            return html
+    return html[match.start() :]
+
+
+def parse_document_items(html: str) -> list[dict]:
+    if "gw-document-item" not in html:
+        return []
+
+    soup = BeautifulSoup(
+        document_items_region(html), "html.parser", parse_only=DOCUMENT_ITEMS
+    )
     links: list[dict] = []
 
     for item in soup.select("div.gw-document-item"):
@@ -33,8 +138,7 @@ def find_schedule_links(html: str) -> list[dict]:
             continue
 
         href = download_link["href"]
-        href_lower = href.lower()
-        if ".xls" not in href_lower and ".xlsx" not in href_lower:
+        if not is_excel_href(href):
             continue
 
         title_element = item.select_one(".gw-document-item__overview")
@@ -43,55 +147,170 @@ def find_schedule_links(html: str) -> list[dict]:
         else:
             description = download_link.get_text(" ", strip=True)
 
-        filename_match = re.search(r"[^/]+$", href)
-        filename = filename_match.group(0) if filename_match else "schedule.xls"
+        links.append(schedule_link_entry(href, description))
 
-        absolute_url = href if href.startswith("http") else f"{BASE_URL}{href}"
+    return links
 
-        links.append(
-            {
-                "url": absolute_url,
-                "filename": filename,
-                "description": description or filename,
-            }
-        )
 
-    if links:
-        return links
+def parse_fallback_links(html: str) -> list[dict]:
+    soup = BeautifulSoup(html, "html.parser")
+    links: list[dict] = []
+    # Текст общего родителя считаем один раз, а не для каждой ссылки внутри
+    parent_texts: dict[int, str] = {}
 
     for a in soup.find_all("a", href=True):
         href = a["href"]
-        href_lower = href.lower()
-        if ".xls" not in href_lower and ".xlsx" not in href_lower:
+        if not is_excel_href(href):
             continue
 
-        text = a.get_text(" ", strip=True)
-        parts = [text]
+        parts = [a.get_text(" ", strip=True)]
         current = a
         for _ in range(3):
             parent = current.parent
             if not parent:
                 break
-            parent_text = parent.get_text(" ", strip=True)
+            parent_text = parent_texts.get(id(parent))
+            if parent_text is None:
+                parent_text = parent.get_text(" ", strip=True)
+                parent_texts[id(parent)] = parent_text
             parts.append(parent_text)
             current = parent
 
         context_text = " ".join(dict.fromkeys(" ".join(parts).split()))
+        links.append(schedule_link_entry(href, context_text))
 
-        filename_match = re.search(r"[^/]+$", href)
-        filename = filename_match.group(0) if filename_match else "schedule.xls"
+    return links
 
-        absolute_url = href if href.startswith("http") else f"{BASE_URL}{href}"
 
-        links.append(
-            {
-                "url": absolute_url,
-                "filename": filename,
-                "description": context_text or filename,
-            }
-        )
+def parse_schedule_links(html: str) -> list[dict]:
+    links = parse_document_items(html)
+    if links or not is_excel_href(html):
+        return links
+    return parse_fallback_links(html)
+
+
+# (ключ страницы, ссылки) - одна запись, чтобы параллельный вызов
+# не увидел старый ключ вместе с новыми ссылками
+_links_cache: dict = {"entry": None}
 
-    return links
+
+@timed("find_schedule_links")
+def find_schedule_links(html: str) -> list[dict]:
+    # Страница между проверками обычно не меняется - тогда не разбираем её заново
+    # Абсолютные адреса строятся от BASE_URL, поэтому он тоже часть ключа
+    digest = (BASE_URL, hashlib.sha256(html.encode("utf-8", "surrogatepass")).digest())
+    entry = _links_cache["entry"]
+    hit = entry is not None and entry[0] == digest
+    count_cache("links", hit)
+    if not hit:
+        entry = (digest, parse_schedule_links(html))
+        _links_cache["entry"] = entry
+    return [dict(link) for link in entry[1]]
+
+
+_page_cache: dict = {"entry": None, "error": None, "generation": 0}
+_page_fetch_lock = threading.Lock()
+
+
+def fresh_students_page(ttl: float | None = None) -> tuple[str, list[dict]] | None:
+    ttl = PAGE_CACHE_TTL if ttl is None else ttl
+    entry = _page_cache["entry"]
+    if entry and time.monotonic() - entry[0] < ttl:
+        return entry[1], entry[2]
+    return None
+
+
+def store_students_page(html: str, links: list[dict]) -> None:
+    _page_cache["entry"] = (time.monotonic(), html, links)
+
+
+def get_students_page(ttl: float | None = None) -> tuple[str, list[dict]]:
+    # Страница студентов + ссылки на файлы, не чаще раза в ttl секунд.
+    # Если кэш устарел одновременно у нескольких, на сайт идёт только один запрос.
+    fresh = fresh_students_page(ttl)
+    count_cache("page", fresh is not None)
+    if fresh:
+        return fresh
+
+    generation = _page_cache["generation"]
+    with _page_fetch_lock:
+        if _page_cache["generation"] != generation:
+            # Пока ждали блокировку, страницу уже кто-то загрузил
+            if _page_cache["error"] is not None:
+                raise _page_cache["error"]
+            entry = _page_cache["entry"]
+            return entry[1], entry[2]
+
+        try:
+            html = fetch_page(STUDENTS_URL)
+            links = find_schedule_links(html)
+        except Exception as exc:
+            _page_cache["error"] = exc
+            _page_cache["generation"] += 1
+            raise
+
+        store_students_page(html, links)
+        _page_cache["error"] = None
+        _page_cache["generation"] += 1
+        return html, links
+
+
+def get_schedule_links(ttl: float | None = None) -> list[dict]:
+    return get_students_page(ttl)[1]
+
+
+def invalidate_page_cache() -> None:
+    _page_cache["entry"] = None
+
+
+def extract_schedule_date(link: dict) -> date | None:
+    text = f"{link.get('filename', '')} {link.get('description', '')}"
+
+    match = re.search(r"(\d{1,2})[.\-/](\d{1,2})", text)
+    if match:
+        day = int(match.group(1))
+        month = int(match.group(2))
+        year = datetime.now().year
+        try:
+            return date(year, month, day)
+        except ValueError:
+            pass
+
+    text_lower = text.lower()
+    match = re.search(
+        r"(\d{1,2})\s*(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)",
+        text_lower,
+    )
+    if not match:
+        return None
+
+    day = int(match.group(1))
+    month_name = match.group(2)
+
+    months = {
+        "января": 1,
+        "февраля": 2,
+        "марта": 3,
+        "апреля": 4,
+        "мая": 5,
+        "июня": 6,
+        "июля": 7,
+        "августа": 8,
+        "сентября": 9,
+        "октября": 10,
+        "ноября": 11,
+        "декабря": 12,
+    }
+
+    month = months.get(month_name)
+    if not month:
+        return None
+
+    year = datetime.now().year
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
 
 
 def choose_link(links: list[dict]) -> dict | None:
@@ -120,6 +339,51 @@ def choose_link(links: list[dict]) -> dict | None:
         return links[index - 1]
 
 
+def load_download_validators(target_dir: Path) -> dict[str, dict]:
+    path = target_dir / VALIDATORS_FILENAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def store_download_validators(target_dir: Path, url: str, validators: dict) -> None:
+    with _download_validators_lock:
+        data = load_download_validators(target_dir)
+        data[url] = validators
+        path = target_dir / VALIDATORS_FILENAME
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(path)
+
+
+def revalidation_headers(file_info: dict, target_path: Path) -> dict[str, str]:
+    # Условный запрос имеет смысл, только если локальная копия цела
+    if not target_path.exists():
+        return {}
+    cached = load_download_validators(target_path.parent).get(file_info["url"])
+    if not cached or cached.get("size") != target_path.stat().st_size:
+        return {}
+    return conditional_headers(cached)
+
+
+def save_downloaded_file(target_path: Path, content: bytes) -> None:
+    # Пишем рядом и подменяем целиком: читатель в другом процессе или потоке
+    # не должен увидеть наполовину записанный xls
+    tmp_path = target_path.with_name(
+        f"{target_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    tmp_path.write_bytes(content)
+    tmp_path.replace(target_path)
+    _file_hash_cache[target_path] = (
+        file_stamp(target_path),
+        hashlib.sha256(content).hexdigest(),
+    )
+
+
+@timed("download_file")
 def download_file(file_info: dict, target_dir: Path, force: bool = True) -> Path:
     target_dir.mkdir(parents=True, exist_ok=True)
     target_path = target_dir / file_info["filename"]
@@ -128,79 +392,99 @@ def download_file(file_info: dict, target_dir: Path, force: bool = True) -> Path
         print(f"\nФайл уже скачан, повторная загрузка не требуется: {target_path}")
         return target_path
 
+    headers = revalidation_headers(file_info, target_path)
+
     print(f"\nСкачиваю файл: {file_info['url']}")
-    response = requests.get(file_info["url"], timeout=60, verify=False)
+    response = requests.get(file_info["url"], timeout=60, verify=False, headers=headers)
+    HTTP_RESPONSES.inc(kind="file", status=response.status_code)
+    if response.status_code == 304 and headers:
+        print(f"Файл не изменился, используем локальную копию: {target_path}")
+        return target_path
     response.raise_for_status()
 
-    target_path.write_bytes(response.content)
+    save_downloaded_file(target_path, response.content)
+    store_download_validators(
+        target_dir,
+        file_info["url"],
+        response_validators(response.headers, len(response.content)),
+    )
     print(f"Файл сохранён в: {target_path}")
 
     return target_path
 
 
-def read_excel_rows(path: Path) -> list[list[str]]:
+_file_hash_cache: dict[Path, tuple[tuple[int, int], str]] = {}
+
+
+def file_sha256(path: Path) -> str:
+    stamp = file_stamp(path)
+    cached = _file_hash_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    _file_hash_cache[path] = (stamp, digest)
+    return digest
+
+
+def trim_row(values) -> list[str]:
+    row = [str(cell).strip() if cell is not None else "" for cell in values]
+    while row and not row[-1]:
+        row.pop()
+    return row
+
+
+def iter_excel_rows(path: Path) -> Iterator[list[str]]:
+    # Потоковое чтение первого листа: строки по одной, без хвостовых пустых ячеек
     suffix = path.suffix.lower()
-    rows: list[list[str]] = []
 
     if suffix in (".xlsx", ".xlsm"):
-        workbook = openpyxl.load_workbook(path, data_only=True)
-        sheet = workbook.active
-        for row in sheet.iter_rows(values_only=True):
-            rows.append(
-                [str(cell).strip() if cell is not None else "" for cell in row]
-            )
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            for row in sheet.iter_rows(values_only=True):
+                yield trim_row(row)
+        finally:
+            workbook.close()
     elif suffix == ".xls":
-        book = xlrd.open_workbook(str(path))
-        sheet = book.sheet_by_index(0)
-        for row_idx in range(sheet.nrows):
-            row_values = sheet.row_values(row_idx)
-            rows.append(
-                [str(cell).strip() if cell is not None else "" for cell in row_values]
-            )
+        book = xlrd.open_workbook(str(path), on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for row_idx in range(sheet.nrows):
+                yield trim_row(sheet.row_values(row_idx))
+        finally:
+            book.release_resources()
     else:
         print("Неизвестное расширение файла, не могу прочитать.")
 
-    return rows
 
+def read_excel_rows(path: Path) -> list[list[str]]:
+    return list(iter_excel_rows(path))
 
-def parse_schedule_for_group(rows: list[list[str]], group_query: str) -> list[dict]:
-    group_query = group_query.lower().strip()
-
-    def normalize_group(text: str) -> str:
-        return re.sub(r"\s+", "", text.lower())
 
-    def parse_pair_index(value: str) -> int | None:
-        value = value.strip()
-        if not value:
-            return None
-        match = re.match(r"^(\d+)(?:[.,]0+)?$", value)
-        if not match:
-            return None
-        return int(match.group(1))
+PAIR_COL = 1
+TIME_COL = 3
+GROUP_FIRST_COL = 4
+SCHEDULE_FIELDS = ("pair", "time", "subject", "teacher", "room")
 
-    target = normalize_group(group_query)
 
-    group_col = -1
-    group_row_idx = -1
+def normalize_group(text: str) -> str:
+    return re.sub(r"\s+", "", text.lower())
 
-    for r_idx, row in enumerate(rows):
-        for c_idx, cell in enumerate(row):
-            cell_clean = str(cell).strip()
-            if not cell_clean:
-                continue
-            if normalize_group(cell_clean).startswith(target):
-                group_col = c_idx
-                group_row_idx = r_idx
-                break
-        if group_col != -1:
-            break
 
-    if group_col == -1:
-        return []
+def parse_pair_index(value: str) -> int | None:
+    value = value.strip()
+    if not value:
+        return None
+    match = re.match(r"^(\d+)(?:[.,]0+)?$", value)
+    if not match:
+        return None
+    return int(match.group(1))
 
-    time_col = 3
-    pair_col = 1
 
+def parse_group_column(
+    rows: list[list[str]], group_row_idx: int, group_col: int
+) -> list[dict]:
     schedule: list[dict] = []
     has_pairs = False
     r = group_row_idx + 1
@@ -223,8 +507,8 @@ def parse_schedule_for_group(rows: list[list[str]], group_query: str) -> list[di
             continue
 
         pair_value = ""
-        if pair_col < len(row):
-            pair_value = str(row[pair_col]).strip()
+        if PAIR_COL < len(row):
+            pair_value = str(row[PAIR_COL]).strip()
 
         pair_index = parse_pair_index(pair_value)
         if pair_index is None:
@@ -235,8 +519,8 @@ def parse_schedule_for_group(rows: list[list[str]], group_query: str) -> list[di
             break
 
         time_value = ""
-        if time_col < len(row):
-            time_value = str(row[time_col]).strip()
+        if TIME_COL < len(row):
+            time_value = str(row[TIME_COL]).strip()
 
         room = ""
         room_col = group_col + 3
@@ -267,6 +551,411 @@ def parse_schedule_for_group(rows: list[list[str]], group_query: str) -> list[di
     return schedule
 
 
+def parse_schedule_for_group(rows: list[list[str]], group_query: str) -> list[dict]:
+    headers = group_headers(rows)
+    key, _ = resolve_group_key(sorted(headers), group_query)
+    if key is None:
+        return []
+    return parse_group_column(rows, *headers[key])
+
+
+def group_headers(rows: Iterable[list[str]]) -> dict[str, tuple[int, int]]:
+    # Заголовки групп листа -> (строка, колонка) первого вхождения
+    headers: dict[str, tuple[int, int]] = {}
+    for r_idx, row in enumerate(rows):
+        if not is_group_header_row(row):
+            continue
+        for c_idx in range(GROUP_FIRST_COL, len(row)):
+            cell = str(row[c_idx]).strip()
+            if cell:
+                headers.setdefault(normalize_group(cell), (r_idx, c_idx))
+    return headers
+
+
+def is_group_header_row(row: list[str]) -> bool:
+    # Строка с номерами групп: в служебных колонках стоит "№" или "Группа:"
+    for cell in row[:GROUP_FIRST_COL]:
+        label = str(cell).strip().lower()
+        if label == "№" or label.startswith("группа"):
+            return True
+    return False
+
+
+def build_schedule_index(rows: Iterable[list[str]]) -> dict[str, list[dict]]:
+    # Один проход по строкам: все группы -> их пары, ключ - normalize_group(заголовок).
+    # Строки можно отдавать генератором: каждая колонка группы разбирается
+    # так же, как в parse_group_column, но без возврата к прошлым строкам.
+    index: dict[str, list[dict]] = {}
+    active: list[dict] = []
+
+    for r_idx, row in enumerate(rows):
+        row_text = None
+        still_active: list[dict] = []
+
+        for column in active:
+            group_col = column["col"]
+            pending = column["pending"]
+            if pending is not None:
+                # Строка под парой: преподаватель и, если не нашлась, аудитория
+                if group_col < len(row):
+                    pending["teacher"] = str(row[group_col]).strip()
+                room_col = group_col + 3
+                if not pending["room"] and room_col < len(row):
+                    pending["room"] = str(row[room_col]).strip()
+                column["pending"] = None
+                still_active.append(column)
+                continue
+
+            if r_idx > column["header"] + 1:
+                if row_text is None:
+                    row_text = " ".join(row).lower()
+                if "группа" in row_text:
+                    continue
+
+            still_active.append(column)
+
+            if group_col >= len(row):
+                continue
+
+            subject = str(row[group_col]).strip()
+            if not subject:
+                continue
+
+            pair_value = ""
+            if PAIR_COL < len(row):
+                pair_value = str(row[PAIR_COL]).strip()
+
+            pair_index = parse_pair_index(pair_value)
+            if pair_index is None:
+                continue
+
+            if column["has_pairs"] and pair_index == 1:
+                still_active.pop()
+                continue
+
+            time_value = ""
+            if TIME_COL < len(row):
+                time_value = str(row[TIME_COL]).strip()
+
+            room = ""
+            room_col = group_col + 3
+            if room_col < len(row):
+                room = str(row[room_col]).strip()
+
+            entry = {
+                "pair": pair_value,
+                "time": time_value,
+                "subject": subject,
+                "teacher": "",
+                "room": room,
+            }
+            column["schedule"].append(entry)
+            column["has_pairs"] = True
+            column["pending"] = entry
+
+        active = still_active
+
+        if not is_group_header_row(row):
+            continue
+        for c_idx in range(GROUP_FIRST_COL, len(row)):
+            cell_clean = str(row[c_idx]).strip()
+            if not cell_clean:
+                continue
+            key = normalize_group(cell_clean)
+            if key in index:
+                continue
+            schedule: list[dict] = []
+            index[key] = schedule
+            active.append(
+                {
+                    "header": r_idx,
+                    "col": c_idx,
+                    "schedule": schedule,
+                    "has_pairs": False,
+                    "pending": None,
+                }
+            )
+
+    return index
+
+
+# Разрешение группы по запросу: сначала точное совпадение, потом по началу.
+# По началу принимаем только если номер группы указан целиком ("158" -> "158э"),
+# иначе ("15") возвращаем варианты, а не первую попавшуюся группу.
+GROUP_SUGGESTIONS = 5
+GROUP_KEYS_CACHE_SIZE = 16
+
+_group_keys_cache: dict[int, tuple[dict, list[str]]] = {}
+
+
+def group_number(key: str) -> str:
+    return re.match(r"\d*", key).group(0)
+
+
+def group_sort_key(key: str) -> tuple:
+    number = group_number(key)
+    return (0, int(number), key) if number else (1, 0, key)
+
+
+def group_keys(index: dict[str, list[dict]]) -> list[str]:
+    cached = _group_keys_cache.get(id(index))
+    if cached and cached[0] is index:
+        return cached[1]
+    keys = sorted(index)
+    _group_keys_cache[id(index)] = (index, keys)
+    while len(_group_keys_cache) > GROUP_KEYS_CACHE_SIZE:
+        _group_keys_cache.pop(next(iter(_group_keys_cache)))
+    return keys
+
+
+def group_candidates(keys: list[str], group_query: str, limit: int | None = None) -> list[str]:
+    # keys отсортированы: все группы с таким началом лежат подряд
+    target = normalize_group(group_query.strip())
+    matched: list[str] = []
+    for key in keys[bisect_left(keys, target) :]:
+        if not key.startswith(target):
+            break
+        matched.append(key)
+    number = group_number(target)
+    matched.sort(key=lambda key: (group_number(key) != number, group_sort_key(key)))
+    return matched[:limit] if limit else matched
+
+
+def resolve_group_key(keys: list[str], group_query: str) -> tuple[str | None, list[str]]:
+    target = normalize_group(group_query.strip())
+    if not target:
+        return None, []
+
+    pos = bisect_left(keys, target)
+    if pos < len(keys) and keys[pos] == target:
+        return target, []
+
+    candidates = group_candidates(keys, target)
+    number = group_number(target)
+    if len(candidates) == 1 and number and group_number(candidates[0]) == number:
+        return candidates[0], []
+    if candidates:
+        return None, candidates[:GROUP_SUGGESTIONS]
+    return None, get_close_matches(target, keys, n=GROUP_SUGGESTIONS, cutoff=0.6)
+
+
+def resolve_group(
+    index: dict[str, list[dict]], group_query: str
+) -> tuple[str | None, list[str]]:
+    return resolve_group_key(group_keys(index), group_query)
+
+
+@timed("lookup_group_schedule")
+def lookup_group_schedule(index: dict[str, list[dict]], group_query: str) -> list[dict]:
+    key, _ = resolve_group(index, group_query)
+    if key is None:
+        return []
+    return index[key]
+
+
+def schedule_hash(schedule: list[dict]) -> str:
+    # Канонический отпечаток пар группы: не зависит от имени файла и порядка ключей
+    canonical = [
+        {key: str(item.get(key, "")).strip() for key in SCHEDULE_FIELDS}
+        for item in schedule
+    ]
+    raw = json.dumps(canonical, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_schedule_index_cache: dict[Path, tuple[tuple[int, int], dict[str, list[dict]]]] = {}
+
+
+def file_stamp(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cached_schedule_index(
+    path: Path, stamp: tuple[int, int]
+) -> dict[str, list[dict]] | None:
+    cached = _schedule_index_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    return None
+
+
+def store_schedule_index(
+    path: Path, stamp: tuple[int, int], index: dict[str, list[dict]]
+) -> None:
+    _schedule_index_cache[path] = (stamp, index)
+
+
+# Разобранные файлы храним на диске по sha256 содержимого, чтобы после
+# перезапуска не декодировать xls заново. PARSER_VERSION повышаем при любом
+# изменении разбора - старые снимки тогда просто игнорируются.
+# Тело - компактный JSON, а не pickle: подложенный в каталог кэша файл
+# не должен исполнять код в процессах API и бота.
+SNAPSHOT_MAGIC = b"SCHD"
+SNAPSHOT_FORMAT_VERSION = 2
+PARSER_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct(">4sHH")
+
+
+def snapshot_path(digest: str) -> Path:
+    return SNAPSHOT_DIR / f"{digest}.bin"
+
+
+def load_parsed_snapshot(digest: str) -> dict[str, list[dict]] | None:
+    path = snapshot_path(digest)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if len(data) < _SNAPSHOT_HEADER.size:
+        return None
+    magic, format_version, parser_version = _SNAPSHOT_HEADER.unpack_from(data)
+    if (
+        magic != SNAPSHOT_MAGIC
+        or format_version != SNAPSHOT_FORMAT_VERSION
+        or parser_version != PARSER_VERSION
+    ):
+        return None
+    try:
+        index = json.loads(data[_SNAPSHOT_HEADER.size :].decode("utf-8"))
+    except ValueError:
+        return None
+    return index if isinstance(index, dict) else None
+
+
+def save_parsed_snapshot(digest: str, index: dict[str, list[dict]]) -> None:
+    path = snapshot_path(digest)
+    header = _SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, PARSER_VERSION
+    )
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(
+            header
+            + json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+        tmp_path.replace(path)
+    except OSError:
+        pass
+
+
+def parse_schedule_file(path: Path) -> dict[str, list[dict]]:
+    digest = file_sha256(path)
+    index = load_parsed_snapshot(digest)
+    count_cache("snapshot", index is not None)
+    if index is not None:
+        return index
+
+    # Чтение и разбор идут одним потоком, поэтому меряются вместе
+    with STAGE_SECONDS.time(stage="parse_schedule_file"), span(
+        "parse_schedule_file", file=path.name
+    ):
+        index = build_schedule_index(iter_excel_rows(path))
+    save_parsed_snapshot(digest, index)
+    return index
+
+
+def load_schedule_index(path: Path) -> dict[str, list[dict]]:
+    stamp = file_stamp(path)
+    index = cached_schedule_index(path, stamp)
+    count_cache("index", index is not None)
+    if index is not None:
+        return index
+
+    index = parse_schedule_file(path)
+    store_schedule_index(path, stamp, index)
+    return index
+
+
+# Короткий стабильный ID разобранного файла (начало sha256). Кнопки бота
+# и клиенты API передают его обратно и получают ровно тот файл, который
+# видели, без повторного похода на сайт и пересчёта "сегодня/завтра".
+SNAPSHOT_ID_LENGTH = 12
+SNAPSHOT_ID_RE = re.compile(rf"[0-9a-f]{{{SNAPSHOT_ID_LENGTH}}}")
+PINNED_CACHE_SIZE = 8
+
+_snapshot_registry: dict[str, dict] = {}
+_pinned_indexes: dict[str, dict[str, list[dict]]] = {}
+_snapshot_lock = threading.Lock()
+
+
+def snapshot_id(digest: str) -> str:
+    return digest[:SNAPSHOT_ID_LENGTH]
+
+
+def snapshot_meta_path(digest: str) -> Path:
+    return SNAPSHOT_DIR / f"{digest}.json"
+
+
+def register_snapshot(path: Path, link: dict, d: date | None = None) -> str:
+    digest = file_sha256(path)
+    sid = snapshot_id(digest)
+    meta = _snapshot_registry.get(sid)
+    if meta and meta["sha256"] == digest and (meta["date"] or not d):
+        return sid
+
+    meta = {
+        "sha256": digest,
+        "path": str(path),
+        "link": link,
+        "date": d.isoformat() if d else None,
+    }
+    with _snapshot_lock:
+        _snapshot_registry[sid] = meta
+        # Рядом со снимком, чтобы ID пережил перезапуск и был общим для бота и API
+        meta_path = snapshot_meta_path(digest)
+        try:
+            meta_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = meta_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(meta_path)
+        except OSError:
+            pass
+    return sid
+
+
+def resolve_snapshot(sid: str) -> dict | None:
+    if not SNAPSHOT_ID_RE.fullmatch(sid):
+        return None
+    meta = _snapshot_registry.get(sid)
+    if meta is not None:
+        return meta
+    for meta_path in SNAPSHOT_DIR.glob(f"{sid}*.json"):
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        _snapshot_registry[sid] = meta
+        return meta
+    return None
+
+
+def snapshot_date(meta: dict) -> date | None:
+    return date.fromisoformat(meta["date"]) if meta.get("date") else None
+
+
+def load_snapshot_index(meta: dict) -> dict[str, list[dict]] | None:
+    # Пока файл на диске тот же - берём общий кэш; если его уже перезалили,
+    # читаем сохранённый снимок именно этой версии
+    path = Path(meta["path"])
+    digest = meta["sha256"]
+    if path.exists() and file_sha256(path) == digest:
+        return load_schedule_index(path)
+
+    index = _pinned_indexes.get(digest)
+    count_cache("pinned", index is not None)
+    if index is not None:
+        return index
+    index = load_parsed_snapshot(digest)
+    if index is not None:
+        with _snapshot_lock:
+            _pinned_indexes[digest] = index
+            while len(_pinned_indexes) > PINNED_CACHE_SIZE:
+                _pinned_indexes.pop(next(iter(_pinned_indexes)))
+    return index
+
+
 def main() -> None:
     print("Загружаю страницу студентов...")
     html = fetch_page(STUDENTS_URL)
@@ -281,8 +970,7 @@ def main() -> None:
         print("Файл не выбран, выходим.")
         return
 
-    download_dir = Path("downloads")
-    downloaded_path = download_file(chosen, download_dir)
+    downloaded_path = download_file(chosen, DOWNLOAD_DIR)
 
     group_query = input(
         "\nВведите номер или название группы (например, 158): "
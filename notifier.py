@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from metrics import NOTIFY_SEND_SECONDS, NOTIFY_SENDS
+
+
+# Ограничения Telegram: ~30 сообщений/с на бота, 1 сообщение/с в личный
+# чат и ~20 сообщений/мин в группу.
+GLOBAL_RATE = float(os.environ.get("NOTIFY_GLOBAL_RATE", "25"))
+PRIVATE_CHAT_RATE = float(os.environ.get("NOTIFY_PRIVATE_CHAT_RATE", "1"))
+GROUP_CHAT_RATE = float(os.environ.get("NOTIFY_GROUP_CHAT_RATE", str(20 / 60)))
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", "20"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", "3"))
+NOTIFY_RETRY_DELAY = float(os.environ.get("NOTIFY_RETRY_DELAY", "1"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def block_for(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_global_bucket: TokenBucket | None = None
+_chat_buckets: dict[int, TokenBucket] = {}
+_send_slots = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+
+def get_global_bucket() -> TokenBucket:
+    global _global_bucket
+    if _global_bucket is None:
+        _global_bucket = TokenBucket(GLOBAL_RATE, capacity=GLOBAL_RATE)
+    return _global_bucket
+
+
+def get_chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        # Отрицательные id - групповые чаты
+        rate = GROUP_CHAT_RATE if chat_id < 0 else PRIVATE_CHAT_RATE
+        bucket = TokenBucket(rate)
+        _chat_buckets[chat_id] = bucket
+    return bucket
+
+
+# Итог отправки: sent, forbidden (бот удалён/заблокирован, чата нет или он
+# переехал в супергруппу - повторять бессмысленно) или failed (стоит
+# повторить этому чату на следующей проверке)
+async def send_limited(bot: Bot, chat_id: int, text: str, **kwargs) -> str:
+    chat_bucket = get_chat_bucket(chat_id)
+    for attempt in range(NOTIFY_MAX_ATTEMPTS):
+        await chat_bucket.acquire()
+        await get_global_bucket().acquire()
+        try:
+            with NOTIFY_SEND_SECONDS.time():
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            NOTIFY_SENDS.inc(result="sent")
+            return "sent"
+        except TelegramRetryAfter as exc:
+            # Telegram просит подождать - притормаживаем всю рассылку
+            NOTIFY_SENDS.inc(result="retry_after")
+            get_global_bucket().block_for(exc.retry_after)
+            chat_bucket.block_for(exc.retry_after)
+        except (TelegramNetworkError, TelegramServerError):
+            # Сбой сети или сервера Telegram - повторяем здесь же с паузой
+            NOTIFY_SENDS.inc(result="transient")
+            if attempt + 1 < NOTIFY_MAX_ATTEMPTS:
+                await asyncio.sleep(NOTIFY_RETRY_DELAY * 2**attempt)
+        except (TelegramForbiddenError, TelegramMigrateToChat, TelegramNotFound):
+            NOTIFY_SENDS.inc(result="forbidden")
+            return "forbidden"
+        except TelegramBadRequest as exc:
+            NOTIFY_SENDS.inc(result="rejected")
+            print(f"Telegram отклонил сообщение в чат {chat_id}: {exc}")
+            return "forbidden"
+    NOTIFY_SENDS.inc(result="gave_up")
+    return "failed"
+
+
+async def fan_out(
+    bot: Bot, chat_ids: list[int], text: str, **kwargs
+) -> dict[int, str]:
+    # Итог отправки по каждому чату, чтобы повторять только неудачные
+    async def deliver(chat_id: int) -> str:
+        async with _send_slots:
+            try:
+                return await send_limited(bot, chat_id, text, **kwargs)
+            except Exception:
+                NOTIFY_SENDS.inc(result="failed")
+                return "failed"
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+    return dict(zip(chat_ids, results))
@@ -0,0 +1,117 @@
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+from datetime import time as day_time
+
+
+# Когда и как часто проверять сайт. Окна задаются строкой вида
+# "07:00-16:00=300,16:00-22:00=60,22:00-07:00=1800" (интервал в секундах),
+# окно может переходить через полночь.
+DEFAULT_WINDOWS = "07:00-16:00=300,16:00-22:00=60,22:00-07:00=1800"
+
+
+def parse_windows(spec: str) -> list[tuple[day_time, day_time, float]]:
+    windows: list[tuple[day_time, day_time, float]] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        span, _, interval = part.partition("=")
+        start, _, end = span.partition("-")
+        windows.append(
+            (
+                day_time.fromisoformat(start.strip()),
+                day_time.fromisoformat(end.strip()),
+                float(interval),
+            )
+        )
+    return windows
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        windows: list[tuple[day_time, day_time, float]],
+        default_interval: float = 300,
+        fast_interval: float = 60,
+        fast_period: float = 1800,
+        max_backoff: float = 3600,
+        history_size: int = 200,
+    ) -> None:
+        self.windows = windows
+        self.default_interval = default_interval
+        self.fast_interval = fast_interval
+        self.fast_period = fast_period
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.last_change_at: float | None = None
+        # Последние проверки - отдаются экспортером бота на /debug/polls
+        self.history: deque[dict] = deque(maxlen=history_size)
+
+    @classmethod
+    def from_env(cls) -> "PollScheduler":
+        return cls(
+            parse_windows(os.environ.get("WATCH_WINDOWS", DEFAULT_WINDOWS)),
+            default_interval=float(os.environ.get("WATCH_INTERVAL", "300")),
+            fast_interval=float(os.environ.get("WATCH_FAST_INTERVAL", "60")),
+            fast_period=float(os.environ.get("WATCH_FAST_PERIOD", "1800")),
+            max_backoff=float(os.environ.get("WATCH_MAX_BACKOFF", "3600")),
+            history_size=int(os.environ.get("WATCH_HISTORY", "200")),
+        )
+
+    def window_interval(self, now: datetime | None = None) -> float:
+        current = (now or datetime.now()).time()
+        for start, end, interval in self.windows:
+            if start <= end:
+                if start <= current < end:
+                    return interval
+            elif current >= start or current < end:
+                return interval
+        return self.default_interval
+
+    def next_delay(self, now: datetime | None = None) -> float:
+        interval = self.window_interval(now)
+
+        if self.failures:
+            # Экспоненциальная пауза с джиттером, чтобы не долбить упавший сайт.
+            # Степень ограничена: после долгого простоя 2.0 ** failures переполнится
+            backoff = min(self.max_backoff, interval * 2 ** min(self.failures, 16))
+            return backoff / 2 + random.uniform(0, backoff / 2)
+
+        if (
+            self.last_change_at is not None
+            and time.monotonic() - self.last_change_at < self.fast_period
+        ):
+            # Сразу после изменения часто выкладывают правки - смотрим чаще
+            return min(interval, self.fast_interval)
+
+        return interval
+
+    def record(self, outcome: str, duration: float, error: str | None = None) -> float:
+        # partial - рассылка дошла не до всех, повторяем с той же паузой, что и при ошибке
+        if outcome in ("error", "partial"):
+            self.failures += 1
+        else:
+            self.failures = 0
+        if outcome in ("changed", "partial"):
+            self.last_change_at = time.monotonic()
+
+        delay = self.next_delay()
+        self.history.append(
+            {
+                "at": time.time(),
+                "outcome": outcome,
+                "duration": round(duration, 3),
+                "error": error,
+                "next_delay": round(delay, 1),
+                "failures": self.failures,
+            }
+        )
+        return delay
+
+    def recent(self, limit: int | None = None) -> list[dict]:
+        # Новые проверки первыми
+        items = list(reversed(self.history))
+        return items[:limit] if limit else items
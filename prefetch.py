@@ -0,0 +1,49 @@
+from datetime import date
+
+from catalog import catalog_entries, catalog_loop, catalog_ready
+from main import register_snapshot
+from server import build_group_payload
+
+
+# Файлы на ближайшие дни уже скачаны и разобраны фоновым каталогом,
+# поэтому кнопки дней отвечают из памяти без похода в сеть.
+prefetch_loop = catalog_loop
+
+
+def near_day_entries() -> dict[int, dict] | None:
+    if not catalog_ready():
+        return None
+    today = date.today()
+    days: dict[int, dict] = {}
+    for entry in catalog_entries():
+        if entry["status"] != "ok" or not entry["date"]:
+            continue
+        offset = (entry["date"] - today).days
+        if 0 <= offset <= 2:
+            days[offset] = entry
+    return days
+
+
+def prefetched_days() -> dict[int, str] | None:
+    days = near_day_entries()
+    if days is None:
+        return None
+    return {offset: entry["date"].strftime("%d.%m") for offset, entry in days.items()}
+
+
+def prefetched_group_schedule(group: str, offset: int) -> dict | None:
+    days = near_day_entries()
+    if not days or offset not in days:
+        return None
+    entry = days[offset]
+    return build_group_payload(
+        group, entry["link"], entry["path"], entry["index"], entry["date"]
+    )
+
+
+def prefetched_day_snapshots() -> dict[int, str]:
+    days = near_day_entries() or {}
+    return {
+        offset: register_snapshot(entry["path"], entry["link"], entry["date"])
+        for offset, entry in days.items()
+    }
@@ -0,0 +1,128 @@
+import re
+import threading
+from bisect import bisect_left
+
+from main import parse_pair_index
+
+
+# Обратный индекс разобранного файла: преподаватель / аудитория ->
+# пары всех групп. Строится один раз на индекс файла, дальше вопросы
+# "где сейчас Иванов" и "что в 17 на третьей паре" - поиск по словарю.
+LOOKUP_CACHE_SIZE = 16
+
+_lookups: dict[int, tuple[dict, "ScheduleLookup"]] = {}
+_lookups_lock = threading.Lock()
+
+
+def normalize_name(text: str) -> str:
+    text = str(text).lower().replace("ё", "е")
+    return " ".join(re.split(r"[\W_]+", text)).strip()
+
+
+def display_room(text: str) -> str:
+    # Номера из xls приходят числами: "17.0" -> "17"
+    return re.sub(r"^(\d+)[.,]0+$", r"\1", " ".join(str(text).split()))
+
+
+def normalize_room(text: str) -> str:
+    text = display_room(text).lower()
+    return display_room(re.sub(r"^(ауд|каб)\.?\s*", "", text))
+
+
+def split_names(text: str) -> list[str]:
+    return [part.strip() for part in re.split(r"[/;,]", str(text)) if part.strip()]
+
+
+def prefix_keys(keys: list[str], prefix: str) -> list[str]:
+    matched: list[str] = []
+    for key in keys[bisect_left(keys, prefix) :]:
+        if not key.startswith(prefix):
+            break
+        matched.append(key)
+    return matched
+
+
+class ScheduleLookup:
+    def __init__(self, index: dict[str, list[dict]]) -> None:
+        self.index = index
+        self.teachers: dict[str, list[dict]] = {}
+        self.rooms: dict[str, list[dict]] = {}
+        self.room_names: dict[str, str] = {}
+        # Пара -> занятые на ней аудитории, для списка свободных
+        self.busy_by_pair: dict[int, set[str]] = {}
+
+        for group, schedule in index.items():
+            for item in schedule:
+                entry = {"group": group, **item, "pair_index": parse_pair_index(item["pair"])}
+                for name in split_names(item.get("teacher", "")):
+                    self.teachers.setdefault(normalize_name(name), []).append(entry)
+                room = normalize_room(item.get("room", ""))
+                if room:
+                    self.rooms.setdefault(room, []).append(entry)
+                    self.room_names.setdefault(room, display_room(item["room"]))
+                    if entry["pair_index"] is not None:
+                        self.busy_by_pair.setdefault(entry["pair_index"], set()).add(room)
+
+        for entries in (*self.teachers.values(), *self.rooms.values()):
+            entries.sort(key=lambda entry: (entry["pair_index"] or 0, entry["group"]))
+
+        # Отсортированные ключи - для поиска по началу ("бугров" -> "бугров а в")
+        self.teacher_keys = sorted(self.teachers)
+        self.room_order = sorted(self.rooms, key=room_sort_key)
+
+    @staticmethod
+    def match(
+        table: dict[str, list[dict]], keys: list[str], query: str, pair: int | None
+    ) -> list[dict]:
+        if not query:
+            return []
+        if query in table:
+            entries = table[query]
+        else:
+            entries = [entry for key in prefix_keys(keys, query) for entry in table[key]]
+        if pair is not None:
+            entries = [entry for entry in entries if entry["pair_index"] == pair]
+        return entries
+
+    def find_teacher(self, query: str, pair: int | None = None) -> list[dict]:
+        return self.match(self.teachers, self.teacher_keys, normalize_name(query), pair)
+
+    def find_room(self, query: str, pair: int | None = None) -> list[dict]:
+        # Аудитории сравниваем только целиком: "1" не должна находить "17"
+        room = normalize_room(query)
+        entries = self.rooms.get(room, [])
+        if pair is not None:
+            entries = [entry for entry in entries if entry["pair_index"] == pair]
+        return entries
+
+    def busy_rooms(self, pair: int) -> list[str]:
+        busy = self.busy_by_pair.get(pair, set())
+        return [self.room_names[room] for room in self.room_order if room in busy]
+
+    def free_rooms(self, pair: int) -> list[str]:
+        # Свободные - те аудитории из этого файла, где на этой паре никого нет
+        busy = self.busy_by_pair.get(pair, set())
+        return [self.room_names[room] for room in self.room_order if room not in busy]
+
+
+def room_sort_key(room: str) -> tuple:
+    return (0, int(room), "") if room.isdigit() else (1, 0, room)
+
+
+def lookup_for_index(index: dict[str, list[dict]]) -> ScheduleLookup:
+    key = id(index)
+    cached = _lookups.get(key)
+    if cached and cached[0] is index:
+        return cached[1]
+
+    lookup = ScheduleLookup(index)
+    with _lookups_lock:
+        # Держим ссылку на сам индекс, чтобы id не переиспользовался
+        _lookups[key] = (index, lookup)
+        while len(_lookups) > LOOKUP_CACHE_SIZE:
+            _lookups.pop(next(iter(_lookups)))
+    return lookup
+
+
+def public_entry(entry: dict) -> dict:
+    return {key: value for key, value in entry.items() if key != "pair_index"}
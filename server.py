@@ -1,30 +1,84 @@
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
 from pathlib import Path
-from datetime import date, datetime
-import re
+from datetime import date
+import hashlib
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 from main import (
-    STUDENTS_URL,
+    DOWNLOAD_DIR,
     download_file,
-    fetch_page,
-    find_schedule_links,
-    read_excel_rows,
-    parse_schedule_for_group,
+    extract_schedule_date,
+    file_sha256,
+    get_schedule_links,
+    group_candidates,
+    group_keys,
+    group_sort_key,
+    load_snapshot_index,
+    register_snapshot,
+    resolve_group,
+    resolve_snapshot,
+    snapshot_date,
 )
+from catalog import catalog_entry, catalog_loop, catalog_summary
+from metrics import CONTENT_TYPE, count_cache, monitor_event_loop_lag, render_metrics
+from search_index import ScheduleLookup, lookup_for_index, public_entry
+from tracing import add_tags, span, trace, tracing_enabled
+from http_client import close_session, download_file_async, get_schedule_links_async
+from workers import (
+    load_schedule_index_async,
+    load_schedule_index_pooled,
+    run_async,
+    shutdown_executor,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    catalog_task = asyncio.create_task(catalog_loop("api"))
+    lag_task = asyncio.create_task(monitor_event_loop_lag("api"))
+    yield
+    catalog_task.cancel()
+    lag_task.cancel()
+    await close_session()
+    shutdown_executor()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 
+async def trace_requests(request: Request, call_next):
+    params = request.query_params
+    with trace(
+        "request",
+        path=request.url.path,
+        group=params.get("group"),
+        offset=params.get("offset"),
+    ):
+        response = await call_next(request)
+        add_tags(status=response.status_code)
+        return response
+
+
+# Без трассировки middleware не ставим вовсе: BaseHTTPMiddleware
+# заметно удорожает каждый запрос, даже если сразу отдаёт его дальше
+if tracing_enabled():
+    app.middleware("http")(trace_requests)
+
+
 def select_daily_schedule_link(links: list[dict]) -> dict:
     for link in links:
         text = link.get("description", "").lower()
@@ -37,59 +91,7 @@ def select_daily_schedule_link(links: list[dict]) -> dict:
     return links[-1] if links else None
 
 
-def extract_schedule_date(link: dict) -> date | None:
-    text = f"{link.get('filename', '')} {link.get('description', '')}"
-
-    match = re.search(r"(\d{1,2})[.\-/](\d{1,2})", text)
-    if match:
-        day = int(match.group(1))
-        month = int(match.group(2))
-        year = datetime.now().year
-        try:
-            return date(year, month, day)
-        except ValueError:
-            pass
-
-    text_lower = text.lower()
-    match = re.search(
-        r"(\d{1,2})\s*(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)",
-        text_lower,
-    )
-    if not match:
-        return None
-
-    day = int(match.group(1))
-    month_name = match.group(2)
-
-    months = {
-        "января": 1,
-        "февраля": 2,
-        "марта": 3,
-        "апреля": 4,
-        "мая": 5,
-        "июня": 6,
-        "июля": 7,
-        "августа": 8,
-        "сентября": 9,
-        "октября": 10,
-        "ноября": 11,
-        "декабря": 12,
-    }
-
-    month = months.get(month_name)
-    if not month:
-        return None
-
-    year = datetime.now().year
-    try:
-        return date(year, month, day)
-    except ValueError:
-        return None
-
-
-def get_near_schedule_links() -> dict[int, tuple[dict, date]]:
-    html = fetch_page(STUDENTS_URL)
-    links = find_schedule_links(html)
+def resolve_near_schedule_links(links: list[dict]) -> dict[int, tuple[dict, date]]:
     today = date.today()
     result: dict[int, tuple[dict, date]] = {}
     for link in links:
@@ -102,17 +104,14 @@ def get_near_schedule_links() -> dict[int, tuple[dict, date]]:
     return result
 
 
-def get_near_schedule_days() -> dict[int, str]:
-    mapping = get_near_schedule_links()
+def near_schedule_days(mapping: dict[int, tuple[dict, date]]) -> dict[int, str]:
     days: dict[int, str] = {}
     for offset, (_, d) in mapping.items():
         days[offset] = d.strftime("%d.%m")
     return days
 
 
-def fetch_group_schedule(group: str) -> dict:
-    html = fetch_page(STUDENTS_URL)
-    links = find_schedule_links(html)
+def pick_daily_link(links: list[dict]) -> dict:
     if not links:
         raise HTTPException(status_code=500, detail="Не удалось найти файлы расписания")
 
@@ -121,63 +120,406 @@ def fetch_group_schedule(group: str) -> dict:
         raise HTTPException(
             status_code=500, detail="Не удалось выбрать файл расписания"
         )
+    return link
+
+
+def pick_offset_link(
+    mapping: dict[int, tuple[dict, date]], offset: int
+) -> tuple[dict, date]:
+    entry = mapping.get(offset)
+    if not entry:
+        raise HTTPException(
+            status_code=404, detail="Для выбранного дня расписание не найдено"
+        )
+    return entry
 
-    download_dir = Path("downloads")
-    path = download_file(link, download_dir, force=False)
-    rows = read_excel_rows(path)
 
-    if not rows:
+def build_group_payload(
+    group: str,
+    link: dict,
+    path: Path,
+    index: dict[str, list[dict]],
+    d: date | None = None,
+) -> dict:
+    if not index:
         raise HTTPException(
             status_code=500, detail="Файл расписания пуст или не распознан"
         )
 
-    schedule = parse_schedule_for_group(rows, group)
+    matched, suggestions = resolve_group(index, group)
 
-    return {
+    payload = {
         "group": group,
-        "schedule": schedule,
+        "matched_group": matched,
+        "schedule": index[matched] if matched else [],
         "file": path.name,
         "source": str(link.get("url")),
+        "snapshot": register_snapshot(path, link, d),
     }
+    if suggestions:
+        # "Возможно, вы имели в виду" вместо расписания чужой группы
+        payload["suggestions"] = suggestions
+    if d:
+        payload["date"] = d.strftime("%d.%m")
+    return payload
+
+
+def pick_snapshot(snapshot: str) -> dict:
+    meta = resolve_snapshot(snapshot)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Снимок расписания не найден")
+    return meta
+
+
+# Синхронный путь без event loop - точка входа для benchmarks/bench.py;
+# API и бот ходят через асинхронные варианты ниже
+def get_near_schedule_links() -> dict[int, tuple[dict, date]]:
+    return resolve_near_schedule_links(get_schedule_links())
 
 
 def fetch_group_schedule_for_offset(group: str, offset: int) -> dict:
-    mapping = get_near_schedule_links()
-    entry = mapping.get(offset)
-    if not entry:
-        raise HTTPException(
-            status_code=404, detail="Для выбранного дня расписание не найдено"
-        )
-    link, d = entry
+    link, d = pick_offset_link(get_near_schedule_links(), offset)
+    path = download_file(link, DOWNLOAD_DIR, force=False)
+    index = load_schedule_index_pooled(path)
+    return build_group_payload(group, link, path, index, d)
+
+
+# Асинхронные варианты для бота: сеть не блокирует event loop
+
+
+async def get_near_schedule_links_async() -> dict[int, tuple[dict, date]]:
+    return resolve_near_schedule_links(await get_schedule_links_async())
 
-    download_dir = Path("downloads")
-    path = download_file(link, download_dir, force=False)
-    rows = read_excel_rows(path)
 
-    if not rows:
+async def get_near_schedule_days_async() -> dict[int, str]:
+    return near_schedule_days(await get_near_schedule_links_async())
+
+
+async def resolve_daily_file_async() -> tuple[dict, Path]:
+    with span("resolve_file"):
+        link = pick_daily_link(await get_schedule_links_async())
+        add_tags(file=link["filename"])
+        path = await download_file_async(link, DOWNLOAD_DIR, force=False)
+    return link, path
+
+
+async def resolve_offset_file_async(offset: int) -> tuple[dict, Path, date]:
+    with span("resolve_file", offset=offset):
+        link, d = pick_offset_link(await get_near_schedule_links_async(), offset)
+        add_tags(file=link["filename"])
+        path = await download_file_async(link, DOWNLOAD_DIR, force=False)
+    return link, path, d
+
+
+async def fetch_group_schedule_for_offset_async(group: str, offset: int) -> dict:
+    link, path, d = await resolve_offset_file_async(offset)
+    index = await load_schedule_index_async(path)
+    return build_group_payload(group, link, path, index, d)
+
+
+async def fetch_group_schedule_for_snapshot_async(
+    group: str, snapshot: str
+) -> dict | None:
+    meta = resolve_snapshot(snapshot)
+    if meta is None:
+        return None
+    index = await run_async(load_snapshot_index, meta)
+    if not index:
+        return None
+    return build_group_payload(
+        group, meta["link"], Path(meta["path"]), index, snapshot_date(meta)
+    )
+
+
+# Пакетный запрос: много групп x несколько дней за один проход.
+# Каждый файл скачивается и разбирается один раз, группы берутся из его индекса.
+BATCH_MAX_GROUPS = int(os.environ.get("BATCH_MAX_GROUPS", "100"))
+BATCH_MAX_OFFSETS = 3
+
+
+async def load_offset_index_async(
+    mapping: dict[int, tuple[dict, date]], offset: int
+) -> tuple[dict, Path, date, dict[str, list[dict]]]:
+    with span("resolve_file", offset=offset):
+        link, d = pick_offset_link(mapping, offset)
+        # Файл уже скачан и разобран фоновым каталогом - берём оттуда
+        entry = catalog_entry(link["url"])
+        count_cache("catalog", bool(entry and entry["status"] == "ok"))
+        if entry and entry["status"] == "ok":
+            return link, entry["path"], d, entry["index"]
+        path = await download_file_async(link, DOWNLOAD_DIR, force=False)
+    with span("load_schedule_index", file=path.name):
+        index = await load_schedule_index_async(path)
+    return link, path, d, index
+
+
+def batch_items(groups: list[str], offset: int, resolved) -> list[dict]:
+    if isinstance(resolved, HTTPException):
+        error = resolved.detail
+    elif isinstance(resolved, Exception):
+        error = "Не удалось получить файл расписания"
+    else:
+        error = None
+        link, path, d, index = resolved
+
+    items: list[dict] = []
+    for group in groups:
+        if error is None:
+            try:
+                item = build_group_payload(group, link, path, index, d)
+            except HTTPException as exc:
+                item = {"group": group, "error": exc.detail}
+        else:
+            item = {"group": group, "error": error}
+        item["offset"] = offset
+        items.append(item)
+    return items
+
+
+async def iter_batch_items(
+    mapping: dict[int, tuple[dict, date]], groups: list[str], offsets: list[int]
+):
+    async def resolve(offset: int):
+        try:
+            return offset, await load_offset_index_async(mapping, offset)
+        except Exception as exc:
+            return offset, exc
+
+    # Файлы грузятся параллельно, ответы по дню отдаются по мере готовности
+    for done in asyncio.as_completed([resolve(offset) for offset in offsets]):
+        offset, resolved = await done
+        for item in batch_items(groups, offset, resolved):
+            yield item
+
+
+async def fetch_group_schedule_days_async(group: str) -> list[dict]:
+    # Все ближайшие дни сразу: файлы готовятся параллельно,
+    # время ответа - как у самого медленного дня, а не сумма
+    mapping = await get_near_schedule_links_async()
+    offsets = sorted(mapping)
+    days = [item async for item in iter_batch_items(mapping, [group], offsets)]
+    days.sort(key=lambda item: item["offset"])
+    return days
+
+
+async def resolve_lookup_async(
+    offset: int | None = None,
+) -> tuple[dict, Path, date, ScheduleLookup]:
+    # Без offset - ближайший опубликованный день
+    mapping = await get_near_schedule_links_async()
+    if offset is None:
+        if not mapping:
+            raise HTTPException(
+                status_code=404, detail="Для ближайших дней расписание не найдено"
+            )
+        offset = min(mapping)
+    link, path, d, index = await load_offset_index_async(mapping, offset)
+    if not index:
         raise HTTPException(
             status_code=500, detail="Файл расписания пуст или не распознан"
         )
+    return link, path, d, lookup_for_index(index)
 
-    schedule = parse_schedule_for_group(rows, group)
 
+def lookup_payload(link: dict, path: Path, d: date, **fields) -> dict:
     return {
-        "group": group,
-        "schedule": schedule,
+        **fields,
+        "date": d.strftime("%d.%m"),
         "file": path.name,
         "source": str(link.get("url")),
-        "date": d.strftime("%d.%m"),
+        "snapshot": register_snapshot(path, link, d),
     }
 
 
+def unique_values(values: list) -> list:
+    return list(dict.fromkeys(values))
+
+
+def schedule_etag(digest: str, link: dict, group: str, d: date | None = None) -> str:
+    # Зависит только от содержимого файла, ссылки, группы и дня - парсер не нужен.
+    # Группа берётся как есть: тело отдаёт её дословно, значит и тег строгий
+    raw = "|".join(
+        [
+            digest,
+            str(link.get("url")),
+            group,
+            d.isoformat() if d else "",
+        ]
+    )
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+async def schedule_response(
+    request: Request,
+    group: str,
+    link: dict,
+    path: Path,
+    d: date | None = None,
+    snapshot: dict | None = None,
+) -> Response:
+    digest = snapshot["sha256"] if snapshot else file_sha256(path)
+    etag = schedule_etag(digest, link, group, d)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        count_cache("etag", True)
+        add_tags(not_modified=True)
+        return Response(status_code=304, headers=headers)
+    count_cache("etag", False)
+
+    with span("load_schedule_index", file=path.name):
+        if snapshot is not None:
+            index = await run_async(load_snapshot_index, snapshot)
+            if index is None:
+                raise HTTPException(
+                    status_code=404, detail="Снимок расписания больше недоступен"
+                )
+        else:
+            index = await load_schedule_index_async(path)
+    with span("build_group_payload", group=group):
+        payload = build_group_payload(group, link, path, index, d)
+    return JSONResponse(payload, headers=headers)
+
+
 @app.get("/api/schedule")
-def get_schedule(group: str = Query(..., min_length=1)):
-    return fetch_group_schedule(group)
+async def get_schedule(request: Request, group: str = Query(..., min_length=1)):
+    link, path = await resolve_daily_file_async()
+    return await schedule_response(request, group, link, path)
 
 
 @app.get("/api/schedule/by-offset")
-def get_schedule_by_offset(
+async def get_schedule_by_offset(
+    request: Request,
     group: str = Query(..., min_length=1),
-    offset: int = Query(...),
+    offset: int | None = Query(None),
+    snapshot: str | None = Query(None),
+):
+    if snapshot:
+        # Закреплённый файл: ни страницы, ни пересчёта дня
+        meta = pick_snapshot(snapshot)
+        add_tags(snapshot=snapshot, file=Path(meta["path"]).name)
+        return await schedule_response(
+            request,
+            group,
+            meta["link"],
+            Path(meta["path"]),
+            snapshot_date(meta),
+            snapshot=meta,
+        )
+    if offset is None:
+        raise HTTPException(status_code=422, detail="Нужен offset или snapshot")
+    link, path, d = await resolve_offset_file_async(offset)
+    return await schedule_response(request, group, link, path, d)
+
+
+@app.get("/api/schedule/batch")
+async def get_schedule_batch(
+    group: list[str] = Query(..., min_length=1),
+    offset: list[int] = Query([0]),
+    stream: bool = Query(False),
+):
+    groups = unique_values([g.strip() for g in group if g.strip()])
+    offsets = unique_values(offset)
+    if not groups:
+        raise HTTPException(status_code=422, detail="Не указаны группы")
+    if len(groups) > BATCH_MAX_GROUPS or len(offsets) > BATCH_MAX_OFFSETS:
+        raise HTTPException(status_code=422, detail="Слишком большой пакетный запрос")
+    add_tags(groups=len(groups), offsets=",".join(map(str, offsets)))
+    # Страницу берём до начала ответа, чтобы её ошибка пришла обычным статусом
+    mapping = await get_near_schedule_links_async()
+
+    if stream:
+        # NDJSON: по строке на группу и день
+        async def lines():
+            async for item in iter_batch_items(mapping, groups, offsets):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    items = [item async for item in iter_batch_items(mapping, groups, offsets)]
+    items.sort(key=lambda item: offsets.index(item["offset"]))
+    return {"items": items}
+
+
+@app.get("/api/schedule/days")
+async def get_schedule_days(group: str = Query(..., min_length=1)):
+    return {"group": group, "days": await fetch_group_schedule_days_async(group)}
+
+
+@app.get("/api/teacher")
+async def get_teacher(
+    name: str = Query(..., min_length=2),
+    offset: int | None = Query(None),
+    pair: int | None = Query(None),
+):
+    link, path, d, lookup = await resolve_lookup_async(offset)
+    matches = [public_entry(entry) for entry in lookup.find_teacher(name, pair)]
+    return lookup_payload(link, path, d, query=name, pair=pair, matches=matches)
+
+
+@app.get("/api/room")
+async def get_room(
+    room: str = Query(..., min_length=1),
+    offset: int | None = Query(None),
+    pair: int | None = Query(None),
+):
+    link, path, d, lookup = await resolve_lookup_async(offset)
+    matches = [public_entry(entry) for entry in lookup.find_room(room, pair)]
+    return lookup_payload(link, path, d, query=room, pair=pair, matches=matches)
+
+
+@app.get("/api/rooms/free")
+async def get_free_rooms(
+    pair: int = Query(..., ge=1),
+    offset: int | None = Query(None),
+):
+    link, path, d, lookup = await resolve_lookup_async(offset)
+    return lookup_payload(
+        link,
+        path,
+        d,
+        pair=pair,
+        free=lookup.free_rooms(pair),
+        busy=lookup.busy_rooms(pair),
+    )
+
+
+@app.get("/api/groups")
+async def get_groups(
+    q: str = Query(""),
+    offset: int | None = Query(None),
+    limit: int = Query(20, ge=1, le=200),
 ):
-    return fetch_group_schedule_for_offset(group, offset)
+    # Автодополнение: группы файла, начинающиеся с q, по порядку номеров
+    link, path, d, lookup = await resolve_lookup_async(offset)
+    keys = group_keys(lookup.index)
+    if q.strip():
+        matched, suggestions = resolve_group(lookup.index, q)
+        groups = group_candidates(keys, q, limit) or suggestions
+    else:
+        matched = None
+        groups = sorted(keys, key=group_sort_key)[:limit]
+    return lookup_payload(link, path, d, query=q, match=matched, groups=groups)
+
+
+@app.get("/api/catalog")
+async def get_catalog():
+    return {"files": catalog_summary()}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), headers={"Content-Type": CONTENT_TYPE})
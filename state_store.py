@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from main import schedule_hash
+
+
+# Состояние бота в SQLite (WAL): чтение и запись по одному чату,
+# индекс чатов по группе, атомарные изменения без перезаписи всего файла.
+STATE_DB_PATH = Path(os.environ.get("BOT_STATE_DB", "bot_state.sqlite3"))
+LEGACY_STATE_PATH = Path("bot_state.json")
+# Сколько последних дней хранить версии расписания каждой группы
+GROUP_VERSIONS_KEEP = int(os.environ.get("BOT_GROUP_VERSIONS_KEEP", "14"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    grp TEXT NOT NULL,
+    notifications INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS chats_by_group ON chats (grp, notifications);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS group_versions (
+    grp TEXT NOT NULL,
+    day_key TEXT NOT NULL DEFAULT '',
+    schedule_hash TEXT NOT NULL,
+    file_sha256 TEXT,
+    delivered_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (grp, day_key)
+);
+CREATE TABLE IF NOT EXISTS chat_deliveries (
+    chat_id INTEGER PRIMARY KEY,
+    grp TEXT NOT NULL,
+    day_key TEXT NOT NULL,
+    schedule_hash TEXT NOT NULL
+);
+"""
+
+_connection: sqlite3.Connection | None = None
+_lock = threading.RLock()
+
+
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    with _lock:
+        if _connection is None:
+            connection = sqlite3.connect(
+                STATE_DB_PATH, check_same_thread=False, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            _connection = connection
+            migrate_legacy_state()
+        return _connection
+
+
+def close_connection() -> None:
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _connection = None
+
+
+@contextmanager
+def transaction():
+    with _lock:
+        connection = get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+def migrate_legacy_state() -> None:
+    # Однократный перенос из bot_state.json; файл не трогаем
+    if get_meta("legacy_json_migrated") or not LEGACY_STATE_PATH.exists():
+        return
+    try:
+        data = json.loads(LEGACY_STATE_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        data = {}
+
+    with transaction() as connection:
+        for chat_id_str, cfg in (data.get("chats") or {}).items():
+            group = cfg.get("group")
+            if not group:
+                continue
+            connection.execute(
+                "INSERT OR IGNORE INTO chats (chat_id, grp, notifications) VALUES (?, ?, ?)",
+                (int(chat_id_str), group, int(bool(cfg.get("notifications", True)))),
+            )
+        for group, schedule in (data.get("last_schedules_by_group") or {}).items():
+            connection.execute(
+                "INSERT OR IGNORE INTO group_versions (grp, schedule_hash) VALUES (?, ?)",
+                (group, schedule_hash(schedule)),
+            )
+        for key in ("last_schedule_file", "last_schedule_hash"):
+            if data.get(key) is not None:
+                connection.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                    (key, data[key]),
+                )
+        connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_json_migrated', '1')"
+        )
+
+
+def get_meta(key: str) -> str | None:
+    with _lock:
+        row = get_connection().execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def set_meta_values(values: dict[str, str | None]) -> None:
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            list(values.items()),
+        )
+
+
+def set_chat_group(chat_id: int, group: str) -> None:
+    with _lock:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO chats (chat_id, grp, notifications) VALUES (?, ?, 1)",
+            (chat_id, group),
+        )
+
+
+def get_chat(chat_id: int) -> dict | None:
+    with _lock:
+        row = get_connection().execute(
+            "SELECT grp, notifications FROM chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+    if not row:
+        return None
+    return {"group": row[0], "notifications": bool(row[1])}
+
+
+def toggle_notifications(chat_id: int) -> bool | None:
+    with transaction() as connection:
+        cursor = connection.execute(
+            "UPDATE chats SET notifications = 1 - notifications WHERE chat_id = ?",
+            (chat_id,),
+        )
+        if cursor.rowcount == 0:
+            return None
+        row = connection.execute(
+            "SELECT notifications FROM chats WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+    return bool(row[0])
+
+
+def subscribed_chats_by_group() -> dict[str, list[int]]:
+    with _lock:
+        rows = get_connection().execute(
+            "SELECT grp, chat_id FROM chats WHERE notifications = 1 ORDER BY grp"
+        ).fetchall()
+    result: dict[str, list[int]] = {}
+    for group, chat_id in rows:
+        result.setdefault(group, []).append(chat_id)
+    return result
+
+
+# Версии расписания группы хранятся по дням (day_key - дата файла или его
+# адрес): файл на завтра сравнивается только с уже разосланным на завтра
+def get_group_version(group: str, day_key: str) -> dict | None:
+    with _lock:
+        row = get_connection().execute(
+            "SELECT schedule_hash, file_sha256 FROM group_versions WHERE grp = ? AND day_key = ?",
+            (group, day_key),
+        ).fetchone()
+    if not row:
+        return None
+    return {"schedule_hash": row[0], "file_sha256": row[1]}
+
+
+def latest_group_version(group: str) -> dict | None:
+    with _lock:
+        row = get_connection().execute(
+            "SELECT schedule_hash, file_sha256 FROM group_versions WHERE grp = ? "
+            "ORDER BY delivered_at DESC LIMIT 1",
+            (group,),
+        ).fetchone()
+    if not row:
+        return None
+    return {"schedule_hash": row[0], "file_sha256": row[1]}
+
+
+def set_group_version(
+    group: str, day_key: str, version_hash: str, file_sha256: str | None
+) -> None:
+    with transaction() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO group_versions "
+            "(grp, day_key, schedule_hash, file_sha256, delivered_at) VALUES (?, ?, ?, ?, ?)",
+            (group, day_key, version_hash, file_sha256, time.time()),
+        )
+        connection.execute(
+            "DELETE FROM group_versions WHERE grp = ? AND day_key NOT IN ("
+            "SELECT day_key FROM group_versions WHERE grp = ? "
+            "ORDER BY delivered_at DESC LIMIT ?)",
+            (group, group, GROUP_VERSIONS_KEEP),
+        )
+
+
+# Какую версию расписания группы чат уже получил: при повторе рассылки
+# сообщение уходит только тем, кому не дошло в прошлый раз
+def delivered_chats(
+    group: str, day_key: str, version_hash: str, chat_ids: list[int]
+) -> set[int]:
+    with _lock:
+        rows = get_connection().execute(
+            "SELECT chat_id FROM chat_deliveries "
+            "WHERE grp = ? AND day_key = ? AND schedule_hash = ?",
+            (group, day_key, version_hash),
+        ).fetchall()
+    return {row[0] for row in rows} & set(chat_ids)
+
+
+def mark_chats_delivered(
+    group: str, day_key: str, version_hash: str, chat_ids: list[int]
+) -> None:
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO chat_deliveries (chat_id, grp, day_key, schedule_hash) "
+            "VALUES (?, ?, ?, ?)",
+            [(chat_id, group, day_key, version_hash) for chat_id in chat_ids],
+        )
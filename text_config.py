@@ -14,13 +14,24 @@ HELP_TEXT = (
     "❭ /unsubscribe — включить/отключить уведомления о <i>изменении</i> расписания\n\n"
     "❭ /group &lt;группа&gt; — привязать или сменить группу для <i>этого</i> чата\n⛶ <u>/group 158</u>\n\n"
     "❭ /list — показать расписание для привязанной группы\n\n"
-    "❭ /list &lt;группа&gt; — показать расписание указанной группы\n⛶ <u>/list 160</u>\n"
+    "❭ /list &lt;группа&gt; — показать расписание указанной группы\n⛶ <u>/list 160</u>\n\n"
+    "❭ /teacher &lt;фамилия&gt; — пары преподавателя\n⛶ <u>/teacher Иванов</u>\n\n"
+    "❭ /room &lt;аудитория&gt; [пара] — что проходит в аудитории\n⛶ <u>/room 17 3</u>\n\n"
+    "❭ /free &lt;пара&gt; — свободные аудитории на паре\n⛶ <u>/free 3</u>\n\n"
+    "❭ /groups [начало номера] — список групп в расписании\n⛶ <u>/groups 15</u>\n"
 )
 
 DAY_QUESTION_TEXT = "Какой день?"
 DAY_BUTTON_TODAY = "Сегодня"
 DAY_BUTTON_TOMORROW = "Завтра"
 DAY_BUTTON_AFTER_TOMORROW = "Послезавтра"
+DAY_BUTTON_ALL = "Все дни"
+DAY_TITLES = {
+    0: DAY_BUTTON_TODAY,
+    1: DAY_BUTTON_TOMORROW,
+    2: DAY_BUTTON_AFTER_TOMORROW,
+}
+NO_NEAR_SCHEDULE_TEXT = "Для ближайших дней расписание на сайте ещё не опубликовано."
 
 PAIR_NUMBERS = {
     "1": "Первая",
@@ -38,10 +49,27 @@ PAIR_NUMBERS = {
 }
 
 NO_LESSON_SUBJECT = "Пары нет/отменена"
+
+TEACHER_USAGE_TEXT = "Укажите преподавателя. Пример: <code>/teacher Иванов</code>"
+ROOM_USAGE_TEXT = "Укажите аудиторию и, если нужно, пару. Пример: <code>/room 17 3</code>"
+FREE_USAGE_TEXT = "Укажите номер пары. Пример: <code>/free 3</code>"
+LOOKUP_TITLE_TEMPLATE = "✦ {title} — <b>{date}</b>"
+LOOKUP_NOT_FOUND_TEXT = "Ничего не найдено."
+LOOKUP_MAX_ENTRIES = 40
+GROUP_NOT_FOUND_TEMPLATE = "Группа <b>{group}</b> не найдена в расписании."
+GROUP_SUGGESTIONS_TEMPLATE = "Возможно, вы имели в виду: {groups}"
+GROUPS_TITLE_TEMPLATE = "✦ Группы в расписании — <b>{date}</b>"
 EXAM_LINE_TEMPLATE = "📝 {text}"
 PRACTICE_LINE_TEMPLATE = "🛠 {text}"
 
 
+def format_day_title(offset: int, date_str: str | None) -> str:
+    title = DAY_TITLES.get(offset, f"+{offset} дн.")
+    if date_str:
+        title = f"{title} ({date_str})"
+    return f"<b>— {escape(title)} —</b>"
+
+
 def format_header(group: str) -> str:
     return HEADER_TEMPLATE.format(group=escape(group))
 
@@ -98,6 +126,50 @@ def format_room(room: str, changed: bool) -> str:
     return text
 
 
+def format_lookup_entry(entry: dict) -> str:
+    header = format_pair_header(str(entry.get("pair", "")), entry.get("time", ""), False)
+    lines = [f"{header} · гр. <b>{escape(entry['group'])}</b>"]
+    lines.append(format_subject(entry.get("subject", ""), False))
+    if entry.get("teacher"):
+        lines.append(format_teacher(entry["teacher"], False))
+    if entry.get("room"):
+        lines.append(format_room(entry["room"], False))
+    return "\n".join(lines)
+
+
+def format_lookup_result(title: str, date_str: str, entries: list[dict]) -> str:
+    head = LOOKUP_TITLE_TEMPLATE.format(title=escape(title), date=escape(date_str))
+    if not entries:
+        return f"{head}\n\n{LOOKUP_NOT_FOUND_TEXT}"
+    blocks = [format_lookup_entry(entry) for entry in entries[:LOOKUP_MAX_ENTRIES]]
+    if len(entries) > LOOKUP_MAX_ENTRIES:
+        blocks.append(f"… и ещё {len(entries) - LOOKUP_MAX_ENTRIES}")
+    return head + "\n\n" + "\n\n".join(blocks)
+
+
+def format_free_rooms(pair: int, date_str: str, free: list[str], busy: list[str]) -> str:
+    title = f"Свободные аудитории, {PAIR_NUMBERS.get(str(pair), str(pair)).lower()} пара"
+    head = LOOKUP_TITLE_TEMPLATE.format(title=escape(title), date=escape(date_str))
+    free_text = ", ".join(escape(room) for room in free) or "нет"
+    busy_text = ", ".join(escape(room) for room in busy) or "нет"
+    return f"{head}\n\n🟢 {free_text}\n\n<i>Заняты: {busy_text}</i>"
+
+
+def format_group_suggestions(group: str, suggestions: list[str]) -> str:
+    text = GROUP_NOT_FOUND_TEMPLATE.format(group=escape(group))
+    if suggestions:
+        groups = ", ".join(f"<code>{escape(item)}</code>" for item in suggestions)
+        text += "\n" + GROUP_SUGGESTIONS_TEMPLATE.format(groups=groups)
+    return text
+
+
+def format_groups_list(date_str: str, groups: list[str]) -> str:
+    head = GROUPS_TITLE_TEMPLATE.format(date=escape(date_str))
+    if not groups:
+        return f"{head}\n\n{LOOKUP_NOT_FOUND_TEXT}"
+    return head + "\n\n" + ", ".join(f"<code>{escape(group)}</code>" for group in groups)
+
+
 def strike(text: str) -> str:
     return f"<s>{escape(text)}</s>"
 
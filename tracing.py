@@ -0,0 +1,147 @@
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+
+# Трассировка отдельных запросов и циклов вотчера: вложенные замеры этапов
+# с тегами group/file/offset и одна JSON-строка на запрос. Включается
+# SCHEDULE_TRACE=1; выключенная, span() возвращает общий пустой контекст.
+TRACE_ENABLED = os.environ.get("SCHEDULE_TRACE", "") not in ("", "0")
+TRACE_SLOW_MS = float(os.environ.get("SCHEDULE_TRACE_SLOW_MS", "1000"))
+# Куда сохранять cProfile медленных запросов; пусто - не профилировать
+TRACE_PROFILE_DIR = os.environ.get("SCHEDULE_TRACE_PROFILE_DIR", "")
+TRACE_PROFILE_SAMPLE = float(os.environ.get("SCHEDULE_TRACE_PROFILE_SAMPLE", "0.1"))
+
+_NOOP = nullcontext()
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_current_root: ContextVar["Span | None"] = ContextVar("current_root", default=None)
+# В потоке одновременно может работать только один профайлер
+_profile_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "tags", "start", "duration", "children", "token", "root_token")
+
+    def __init__(self, name: str, tags: dict) -> None:
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+        self.duration = 0.0
+        self.children: list[Span] = []
+        self.token = None
+        self.root_token = None
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(self)
+        else:
+            self.root_token = _current_root.set(self)
+        self.token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.tags.setdefault("error", exc_type.__name__)
+        _current_span.reset(self.token)
+        if self.root_token is not None:
+            _current_root.reset(self.root_token)
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "ms": round(self.duration * 1000, 2)}
+        if self.tags:
+            data["tags"] = self.tags
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+class Trace(Span):
+    __slots__ = ("profiler",)
+
+    def __enter__(self) -> "Trace":
+        self.profiler = start_profile()
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        super().__exit__(exc_type, exc, tb)
+        profile_path = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            _profile_lock.release()
+            if self.duration * 1000 >= TRACE_SLOW_MS:
+                profile_path = dump_profile(self.profiler, self.name)
+        emit_trace(self, profile_path)
+
+
+def tracing_enabled() -> bool:
+    return TRACE_ENABLED
+
+
+def span(name: str, **tags):
+    if not TRACE_ENABLED:
+        return _NOOP
+    return Span(name, {key: value for key, value in tags.items() if value is not None})
+
+
+def trace(kind: str, **tags):
+    # Корневой замер: запрос к API или цикл вотчера
+    if not TRACE_ENABLED:
+        return _NOOP
+    return Trace(kind, {key: value for key, value in tags.items() if value is not None})
+
+
+def add_tags(**tags) -> None:
+    # Теги, которые становятся известны по ходу (например, имя файла),
+    # попадают и в текущий этап, и в итоговую строку запроса
+    if not TRACE_ENABLED:
+        return
+    tags = {key: value for key, value in tags.items() if value is not None}
+    for current in (_current_span.get(), _current_root.get()):
+        if current is not None:
+            current.tags.update(tags)
+
+
+def start_profile() -> cProfile.Profile | None:
+    if not TRACE_PROFILE_DIR or random.random() >= TRACE_PROFILE_SAMPLE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    # В event loop профайлер видит и чужие корутины этого потока -
+    # для поиска горячих мест этого достаточно
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump_profile(profiler: cProfile.Profile, kind: str) -> str | None:
+    directory = Path(TRACE_PROFILE_DIR)
+    path = directory / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(10**6):06d}.prof"
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(path))
+    except OSError:
+        return None
+    return str(path)
+
+
+def emit_trace(root: Trace, profile_path: str | None) -> None:
+    record = {
+        "trace": root.name,
+        "at": round(time.time(), 3),
+        "ms": round(root.duration * 1000, 2),
+        "slow": root.duration * 1000 >= TRACE_SLOW_MS,
+        "tags": root.tags,
+        "spans": [child.to_dict() for child in root.children],
+    }
+    if profile_path:
+        record["profile"] = profile_path
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from main import (
+    cached_schedule_index,
+    file_stamp,
+    parse_schedule_file,
+    store_schedule_index,
+)
+from metrics import count_cache
+from tracing import tracing_enabled
+
+
+# Разбор xls и рендер сообщений - CPU-работа, выносим её из event loop
+# и потоков FastAPI в общий ограниченный пул.
+# PARSE_POOL=process - отдельные процессы (все ядра), thread - потоки.
+PARSE_POOL = os.environ.get("PARSE_POOL", "thread")
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARSE_QUEUE_LIMIT = int(os.environ.get("PARSE_QUEUE_LIMIT", str(PARSE_WORKERS * 4)))
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+# Сколько задач может одновременно стоять в пуле; остальные ждут слот
+_slots = threading.BoundedSemaphore(PARSE_QUEUE_LIMIT)
+
+_pending_parses: dict[tuple[Path, tuple[int, int]], Future] = {}
+_pending_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if PARSE_POOL == "process":
+                _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=PARSE_WORKERS, thread_name_prefix="parse"
+                )
+        return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _submit_with_slot(fn, *args) -> Future:
+    try:
+        if tracing_enabled() and PARSE_POOL != "process":
+            # Этапы в потоке пула попадают в трассу вызвавшего запроса
+            future = get_executor().submit(contextvars.copy_context().run, fn, *args)
+        else:
+            future = get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def submit(fn, *args) -> Future:
+    _slots.acquire()
+    return _submit_with_slot(fn, *args)
+
+
+async def submit_async(fn, *args) -> Future:
+    if not _slots.acquire(blocking=False):
+        # Очередь заполнена: ждём слот, не блокируя event loop
+        waiter = asyncio.ensure_future(asyncio.to_thread(_slots.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # Поток всё равно дождётся слота - сразу отдаём его обратно
+            waiter.add_done_callback(lambda _: _slots.release())
+            raise
+    return _submit_with_slot(fn, *args)
+
+
+async def run_async(fn, *args):
+    return await asyncio.wrap_future(await submit_async(fn, *args))
+
+
+def _parse_done(key: tuple[Path, tuple[int, int]], future: Future) -> None:
+    with _pending_lock:
+        _pending_parses.pop(key, None)
+    if not future.cancelled() and future.exception() is None:
+        store_schedule_index(key[0], key[1], future.result())
+
+
+def _pending_parse(key: tuple[Path, tuple[int, int]]) -> Future | None:
+    # Один и тот же файл разбирается один раз, даже если его ждут многие
+    with _pending_lock:
+        return _pending_parses.get(key)
+
+
+def _register_parse(key: tuple[Path, tuple[int, int]], future: Future) -> Future:
+    with _pending_lock:
+        existing = _pending_parses.get(key)
+        if existing is not None:
+            future.cancel()
+            return existing
+        _pending_parses[key] = future
+    future.add_done_callback(lambda done: _parse_done(key, done))
+    return future
+
+
+def load_schedule_index_pooled(path: Path) -> dict[str, list[dict]]:
+    stamp = file_stamp(path)
+    index = cached_schedule_index(path, stamp)
+    count_cache("index", index is not None)
+    if index is not None:
+        return index
+
+    key = (path, stamp)
+    future = _pending_parse(key)
+    if future is None:
+        future = _register_parse(key, submit(parse_schedule_file, path))
+    return future.result()
+
+
+async def load_schedule_index_async(path: Path) -> dict[str, list[dict]]:
+    stamp = file_stamp(path)
+    index = cached_schedule_index(path, stamp)
+    count_cache("index", index is not None)
+    if index is not None:
+        return index
+
+    key = (path, stamp)
+    future = _pending_parse(key)
+    if future is None:
+        future = _register_parse(key, await submit_async(parse_schedule_file, path))
+    return await asyncio.wrap_future(future)